@@ -0,0 +1,436 @@
+"""
+Benchmarks the filter engine (filters.compile_filter, which User.filter_playlist
+runs) on synthetic libraries of songs. The libraries are made up from a seed,
+so every run with the same seed and size filters exactly the same songs, and
+a catalogue of representative filter specs is run over each of them. For each
+spec it reports the first (cold) run over freshly built songs apart from the
+best of the later (warm) runs, the songs filtered per second and the peak
+memory of the cold run, and can save the results as a baseline or compare
+them against a saved one.
+
+Run from anywhere, e.g.
+    python benchmarks/filter_benchmark.py --sizes 1000 100000 --save base.json
+    python benchmarks/filter_benchmark.py --sizes 1000 100000 --compare base.json
+"""
+
+from argparse import ArgumentParser
+from inspect import getsourcefile
+import json
+import os.path as path
+import platform
+import random
+import sys
+from time import perf_counter
+import tracemalloc
+
+cur_dir = path.dirname(path.abspath(getsourcefile(lambda: 0)))
+sys.path.insert(0, path.join(path.dirname(cur_dir), "spearch"))
+
+from filters import compile_filter
+from index import TrackIndex
+from table import TrackLibrary, TrackTable
+
+SIZES = [1000, 10000, 100000, 1000000]
+MODES = ["table", "index"]
+
+# Words song names are made of. Common words come first and are picked more
+# often, like real song names
+WORDS = (
+    "love night heart time baby girl life world home dream fire light day "
+    "way man rain summer blue gold wild young dance run feel stay down away "
+    "boy dark eyes sky sun moon star river road city street ghost angel devil "
+    "money party rock soul body kiss cry lonely broken forever tonight "
+    "tomorrow yesterday sweet crazy little big high low cold hot burning "
+    "falling rising lost found alone together again never always better "
+    "wonder thunder shadow mirror window ocean mountain desert island garden "
+    "paradise heaven hell magic secret stranger lover friend enemy war peace "
+    "freedom memory promise reason season motion emotion danger fever sugar "
+    "honey velvet silver diamond crystal neon electric midnight sunrise "
+    "sunset highway runaway hurricane avalanche"
+).split()
+SUFFIXES = [
+    " - Remastered",
+    " - Remastered 2011",
+    " - Live",
+    " - Acoustic",
+    " - Radio Edit",
+    " (Remix)",
+    " - Single Version",
+    " - Demo",
+]
+SYLLABLES = (
+    "ka lo mi ra ne su ta vi el an or is ba de fo gu ha jo ly ze ré bjö ña ço ü"
+).split()
+ID_CHARS = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def zipf_weights(n, s=1.1):
+    """
+    Returns the cumulative weights of n items picked by a Zipf distribution,
+    the item of rank r being picked in proportion to 1 / r ** s
+    """
+    total = 0
+    weights = []
+    for rank in range(1, n + 1):
+        total += 1 / rank**s
+        weights.append(total)
+    return weights
+
+
+def make_artists(rng, n):
+    """
+    Returns a list of n different made up artist names, most popular first
+    """
+    artists = []
+    seen = set()
+    while len(artists) < n:
+        words = [
+            "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            for _ in range(rng.choice([1, 1, 2, 2, 2, 3]))
+        ]
+        name = " ".join(word.capitalize() for word in words)
+        if rng.random() < 0.1:
+            name = "The " + name
+        elif rng.random() < 0.05:
+            name = name.upper()
+        if name not in seen:
+            seen.add(name)
+            artists.append(name)
+    return artists
+
+
+def make_library(size, seed=0):
+    """
+    Returns (list of the artists most popular first, list of songs) for a
+    made up library of size songs. Songs are tuples of (song, tuple of the
+    artists, song ID) like User.get_playlist_songs gives. Artists are picked
+    by a Zipf distribution, so a few have many songs and most have a few,
+    and about one song in twenty is a second copy of an earlier song like
+    in real playlists. The same size and seed always give the same library.
+
+    Parameters:
+    size - The number of songs
+    seed - (default 0) The seed of the random numbers
+    """
+    rng = random.Random(seed)
+    # The artists are made first so the most popular ones are the same for
+    # every size and the specs can refer to them by rank
+    artists = make_artists(rng, max(300, size // 8))
+    artist_weights = zipf_weights(len(artists))
+    word_weights = zipf_weights(len(WORDS), 0.8)
+
+    songs = []
+    for _ in range(size):
+        if songs and rng.random() < 0.05:
+            songs.append(songs[rng.randrange(len(songs))])
+            continue
+
+        words = rng.choices(WORDS, cum_weights=word_weights, k=rng.randint(1, 4))
+        name = " ".join(words).title() if rng.random() < 0.7 else " ".join(words)
+        song_artists = rng.choices(
+            artists, cum_weights=artist_weights, k=rng.choice([1, 1, 1, 2, 2, 3])
+        )
+        # Keep the order while dropping an artist picked twice
+        song_artists = tuple(dict.fromkeys(song_artists))
+        if len(song_artists) > 1 and rng.random() < 0.5:
+            name += " (feat. {})".format(", ".join(song_artists[1:]))
+        if rng.random() < 0.15:
+            name += rng.choice(SUFFIXES)
+        song_id = "".join(rng.choice(ID_CHARS) for _ in range(22))
+        # Local files have no ID
+        if rng.random() < 0.01:
+            song_id = None
+        songs.append((name, song_artists, song_id))
+    return artists, songs
+
+
+def misspell(rng, text):
+    """
+    Returns text with a letter swapped for another, for the fuzzy specs
+    """
+    position = rng.randrange(len(text))
+    return text[:position] + rng.choice("aeiou") + text[position + 1 :]
+
+
+def make_specs(artists, songs, seed=0):
+    """
+    Returns the catalogue of filter specs as a dictionary of name -> spec,
+    made from the artists and songs of a library so the terms match songs
+    in it
+
+    Parameters:
+    artists - The artists of the library, most popular first
+    songs - The songs of the library
+    seed - (default 0) The seed of the random numbers picking the terms
+    """
+    rng = random.Random(seed)
+    names = [song[0] for song in rng.sample(songs, min(200, len(songs)))]
+
+    # Groups eight deep, AND's of the songs with some common words and OR's
+    # of those or a popular artist
+    deep = {"song_or": WORDS[:3]}
+    for level in range(8):
+        if level % 2:
+            deep = {"_or": [deep, {"artist_or": [artists[level]]}]}
+        else:
+            deep = {"_and": [deep, {"song_or": WORDS[level : level + 20]}]}
+
+    return {
+        "flat_or_artists": {"artist_or": artists[:5]},
+        "flat_or_songs": {"song_or": WORDS[10:18]},
+        "flat_or_mixed": {
+            "artist_or": artists[:3],
+            "artists_or": artists[3:6],
+            "song_or": ["love", "night"],
+            "song_exact": names[:5],
+        },
+        "and_of_ors": {
+            "_and": {
+                "artist_or": artists[:20],
+                "song_or": ["remaster", "live", "remix"],
+            }
+        },
+        "deep_nesting": deep,
+        "not_artists": {"_and": {"_not": True, "artists_or": artists[:10]}},
+        "not_nested": {
+            "_and": {
+                "song_or": ["love", "heart", "baby"],
+                "_or": {"_not": True, "artist_or": artists[:10] + ["feat"]},
+            }
+        },
+        "large_artist_list": {"artist_or": artists[:300]},
+        "large_exclude_list": {"_and": {"_not": True, "artists_or": artists[:300]}},
+        "large_song_list": {"song_or": WORDS[:40] + [name[:6] for name in names]},
+        "exact_songs": {"song_exact": names},
+        "fuzzy_songs": {"song_fuzzy": [misspell(rng, name) for name in names[:5]]},
+        "fuzzy_artists": {
+            "artist_fuzzy": [misspell(rng, artist) for artist in artists[:5]]
+        },
+    }
+
+
+def make_songs(tracks, mode):
+    """
+    Returns the songs a spec is run over, a TrackTable of the tracks or, for
+    the 'index' mode, a TrackIndex of it like User makes with index_songs
+    """
+    songs = TrackTable(tracks, TrackLibrary())
+    if mode == "index":
+        songs = TrackIndex(songs)
+    return songs
+
+
+def run_spec(spec, songs, repeat, fresh):
+    """
+    Returns (cold seconds, warm seconds, peak bytes, number of songs that
+    passed) of compiling and running a spec. The cold run is the first over
+    freshly built songs, before anything was cached or any BK-tree made, and
+    the warm seconds are the best of repeat runs over songs. The peak memory
+    is from a separate cold run, as tracemalloc slows everything down.
+
+    Parameters:
+    spec - The filter spec
+    songs - The songs, already warmed up, for the warm runs
+    repeat - The runs the warm seconds are the best of
+    fresh - Function returning freshly built songs for a cold run
+    """
+    cold_songs = fresh()
+    start = perf_counter()
+    compile_filter(spec).filter(cold_songs)
+    cold = perf_counter() - start
+    _settle(cold_songs)
+
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        passed = compile_filter(spec).filter(songs)
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    cold_songs = fresh()
+    tracemalloc.start()
+    try:
+        compile_filter(spec).filter(cold_songs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    _settle(cold_songs)
+    return cold, best, peak, len(passed)
+
+
+def _settle(songs):
+    """
+    Waits for the BK-trees a fuzzy spec started making on another thread, so
+    they don't slow the runs after it down
+    """
+    if isinstance(songs, TrackIndex) and songs._building is not None:
+        songs.build_trees()
+
+
+def run(sizes, modes, only=None, repeat=3, seed=0, out=sys.stdout):
+    """
+    Runs the catalogue over a library of each size and returns the results as
+    a dictionary of "size/mode/spec" -> dictionary of the results
+
+    Parameters:
+    sizes - The sizes of the libraries
+    modes - 'table' to filter TrackTable's and/or 'index' to filter
+            TrackIndex's like User does with index_songs
+    only - (default None) The names of the specs to run, every one if None
+    repeat - (default 3) The warm runs each time is the best of
+    seed - (default 0) The seed of the random numbers
+    out - (default sys.stdout) Where to write the results as they come
+    """
+    results = {}
+    for size in sizes:
+        start = perf_counter()
+        artists, tracks = make_library(size, seed)
+        print(
+            "\n{} songs, {} artists (made in {:.1f} s)".format(
+                size, len(artists), perf_counter() - start
+            ),
+            file=out,
+        )
+        specs = make_specs(artists, tracks, seed)
+        if only:
+            specs = {name: spec for name, spec in specs.items() if name in only}
+
+        for mode in modes:
+            start = perf_counter()
+            songs = make_songs(tracks, mode)
+            if mode == "index":
+                # Made now so the warm fuzzy runs time searching the BK-trees
+                songs.build_trees()
+            print(
+                "  {} (built in {:.2f} s)".format(mode, perf_counter() - start),
+                file=out,
+            )
+
+            for name, spec in specs.items():
+                cold, seconds, peak, passed = run_spec(
+                    spec, songs, repeat, lambda: make_songs(tracks, mode)
+                )
+                key = "{}/{}/{}".format(size, mode, name)
+                results[key] = {
+                    "cold_seconds": cold,
+                    "seconds": seconds,
+                    "songs_per_second": size / seconds if seconds else None,
+                    "peak_bytes": peak,
+                    "passed": passed,
+                }
+                print(
+                    "    {:<20} {:>9.2f} ms cold {:>9.2f} ms warm {:>12,.0f} songs/s"
+                    " {:>10.1f} KiB peak {:>8} passed".format(
+                        name,
+                        cold * 1000,
+                        seconds * 1000,
+                        size / seconds if seconds else 0,
+                        peak / 1024,
+                        passed,
+                    ),
+                    file=out,
+                )
+    return results
+
+
+def compare(results, baseline, tolerance, out=sys.stdout):
+    """
+    Writes how the results compare to a baseline and returns the list of the
+    keys that regressed, either by taking longer or using more memory than
+    the tolerance allows or by letting different songs through
+
+    Parameters:
+    results - The results of run
+    baseline - The results of an earlier run
+    tolerance - The fraction slower or larger than the baseline allowed
+    out - (default sys.stdout) Where to write the comparison
+    """
+    regressed = []
+    print("\nCompared to the baseline (tolerance {:.0%}):".format(tolerance), file=out)
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print("  {:<40} not in the baseline".format(key), file=out)
+            continue
+
+        time_ratio = result["seconds"] / base["seconds"] if base["seconds"] else 1
+        # Baselines from before cold runs were timed only have the warm time
+        base_cold = base.get("cold_seconds")
+        cold_ratio = result["cold_seconds"] / base_cold if base_cold else 1
+        memory_ratio = (
+            result["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 1
+        )
+        problems = []
+        if time_ratio > 1 + tolerance:
+            problems.append("slower")
+        if cold_ratio > 1 + tolerance:
+            problems.append("slower cold")
+        if memory_ratio > 1 + tolerance:
+            problems.append("more memory")
+        if result["passed"] != base["passed"]:
+            problems.append(
+                "{} passed instead of {}".format(result["passed"], base["passed"])
+            )
+        if problems:
+            regressed.append(key)
+        print(
+            "  {:<40} cold x{:.2f}, warm x{:.2f}, memory x{:.2f}{}".format(
+                key,
+                cold_ratio,
+                time_ratio,
+                memory_ratio,
+                "  REGRESSED: " + ", ".join(problems) if problems else "",
+            ),
+            file=out,
+        )
+    return regressed
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Benchmarks the filter engine")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=SIZES[:3], help="Library sizes"
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=MODES, help="What to filter"
+    )
+    parser.add_argument("--specs", nargs="+", help="Only run the specs named")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per spec")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--save", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="Compare to the results in this file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Fraction slower or larger than the baseline allowed",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.modes, args.specs, args.repeat, args.seed)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("seed", 0) != args.seed:
+            print("The baseline was made with a different seed", file=sys.stderr)
+            return 2
+        if compare(results, baseline["results"], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
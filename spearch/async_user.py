@@ -0,0 +1,446 @@
+from asyncio import (
+    Semaphore,
+    TimeoutError as AsyncTimeoutError,
+    ensure_future,
+    gather,
+    get_event_loop,
+    sleep,
+)
+from collections import deque
+from json import dumps
+from math import ceil
+from time import monotonic
+
+import aiohttp
+
+from playlists import Playlist, PlaylistRegistry
+from scheduler import RequestScheduler
+from song_queue import SongQueue
+from table import TrackLibrary, TrackTable
+from user import User
+
+
+class AsyncRequestScheduler:
+    RETRY_STATUSES = RequestScheduler.RETRY_STATUSES
+    IDEMPOTENT_METHODS = RequestScheduler.IDEMPOTENT_METHODS
+
+    def __init__(self, max_retries=5, backoff=0.5, max_backoff=30):
+        """
+        An asyncio version of scheduler.RequestScheduler's retries. A 429
+        response pauses every request going through it for as long as its
+        Retry-After header asks (or a backoff if it doesn't say), other
+        failures are retried after a jittered exponential backoff, so a sweep
+        of many requests slows down instead of failing. Like there, requests
+        that aren't safe to send twice are only retried after a 429 or
+        failing to connect.
+
+        Parameters:
+        max_retries - (default 5) Times a request is retried before the last
+                      response (or error) is handed back
+        backoff - (default 0.5) Seconds the backoff starts from, it doubles
+                  with every retry
+        max_backoff - (default 30) Most seconds a single backoff can be
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._paused_until = 0
+
+    _backoff = RequestScheduler._backoff
+    _retry_after = RequestScheduler._retry_after
+
+    async def request(self, send, method):
+        """
+        Sends a request once no pause is holding it back and returns the
+        aiohttp response, retrying it if it's rate limited or fails
+
+        Parameters:
+        send - A function that sends the request, returning an awaitable of
+               the response
+        method - The HTTP method, e.g. 'GET'
+        """
+        if method.upper() in self.IDEMPOTENT_METHODS:
+            retry_errors = (aiohttp.ClientConnectionError, AsyncTimeoutError)
+            retry_statuses = self.RETRY_STATUSES
+        else:
+            retry_errors = aiohttp.ClientConnectorError
+            retry_statuses = {429}
+
+        for attempt in range(self.max_retries + 1):
+            await self._wait()
+            try:
+                response = await send()
+            except retry_errors:
+                if attempt == self.max_retries:
+                    raise
+                await sleep(self._backoff(attempt))
+                continue
+
+            if response.status not in retry_statuses or attempt == self.max_retries:
+                return response
+
+            response.release()
+            if response.status == 429:
+                # Rate limits are for the whole app, so hold everyone back
+                self.pause(self._retry_after(response, attempt))
+            else:
+                await sleep(self._backoff(attempt))
+
+    def pause(self, seconds):
+        """
+        Holds back every request for the given number of seconds
+        """
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    async def _wait(self):
+        """
+        Waits until no pause is holding requests back
+        """
+        wait = self._paused_until - monotonic()
+        while wait > 0:
+            await sleep(wait)
+            # Another request may have been rate limited in the meantime
+            wait = self._paused_until - monotonic()
+
+
+class AsyncUser:
+    URL = User.URL
+    TRACK = User.TRACK
+    JSON_HEADERS = User.JSON_HEADERS
+    PLAYLIST_FIELDS = User.PLAYLIST_FIELDS
+    TRACK_FIELDS = User.TRACK_FIELDS
+
+    def __init__(
+        self,
+        token,
+        token_birth,
+        max_concurrency=50,
+        semaphore=None,
+        url=None,
+        token_provider=None,
+        scheduler=None,
+    ):
+        """
+        An asyncio version of User. Nothing is requested until the user is
+        opened, either with `await user.open()` or `async with user:`, which
+        must be done inside the running event loop. Every request waits on a
+        single semaphore so thousands of requests can be gathered at once
+        without more than max_concurrency of them in flight.
+
+        Parameters:
+        token - The access token of the user
+        token_birth - The datetime the access token was made
+        max_concurrency - (default 50) The most requests in flight at once
+        semaphore - (default None) An asyncio.Semaphore to limit the requests
+                    with instead of making one from max_concurrency. Pass the
+                    same one to several AsyncUsers to limit all of them
+                    together
+        url - (default None) The root URL of the API, defaults to
+              AsyncUser.URL. Point it at a local stub server for testing
+        token_provider - (default None) An auth.TokenProvider, its newest
+                         token is used for every request and a request
+                         refused with a 401 refreshes the token and is tried
+                         once more
+        scheduler - (default None) The AsyncRequestScheduler every request
+                    goes through, a new one is made if None. Pass the same
+                    one to several AsyncUsers to pause all of them when one
+                    is rate limited
+        """
+        self.token = token
+        self.token_birth = token_birth
+        self.max_concurrency = max_concurrency
+        self.semaphore = semaphore
+        self.URL = url or self.URL
+        self.ME_URL = self.URL + "me/"
+        self.token_provider = token_provider
+        self.scheduler = AsyncRequestScheduler() if scheduler is None else scheduler
+        self.session = None
+        self.library = TrackLibrary()
+        self.queue = SongQueue()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """
+        Opens the connection pool and gets the user and their playlists
+        """
+        # Made here since asyncio objects belong to the loop they're made in
+        if self.semaphore is None:
+            self.semaphore = Semaphore(self.max_concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency)
+        )
+
+        try:
+            self.user = (await self._request("GET", self.ME_URL))["id"]
+            self.playlists = PlaylistRegistry(await self._get_playlists())
+        except BaseException:
+            # async with doesn't close it when opening fails
+            await self.close()
+            raise
+
+    async def close(self):
+        """
+        Closes the connection pool
+        """
+        await self.session.close()
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Makes a request once a slot in the semaphore is free and returns the
+        parsed JSON response, or None if there is no body. Rate limited and
+        failed requests are retried through self.scheduler.
+        """
+        headers = kwargs.pop("headers", {})
+
+        def send():
+            return self.session.request(
+                method,
+                url,
+                headers=dict(headers, Authorization="Bearer " + self._current_token()),
+                **kwargs
+            )
+
+        async with self.semaphore:
+            token = self._current_token()
+            response = await self.scheduler.request(send, method)
+            # The token expired early or was revoked, so get a new one and retry
+            if response.status == 401 and self.token_provider is not None:
+                response.release()
+                # Refreshing blocks, so keep it off of the event loop
+                await get_event_loop().run_in_executor(
+                    None, self.token_provider.refresh, token
+                )
+                response = await self.scheduler.request(send, method)
+
+            async with response:
+                response.raise_for_status()
+                if response.content_type != "application/json":
+                    return None
+                return await response.json()
+
+    def _current_token(self):
+        """
+        The newest access token
+        """
+        if self.token_provider is not None:
+            self.token = self.token_provider.access_token
+            self.token_birth = self.token_provider.token_birth
+        return self.token
+
+    async def _get_pages(self, url, params_list):
+        """
+        GETs the same url once for each dictionary of parameters all at once.
+        The parsed JSON responses are returned in the same order as
+        params_list.
+        """
+        return await gather(
+            *[self._request("GET", url, params=params) for params in params_list]
+        )
+
+    async def _iter_pages(self, url, params_list, window=None):
+        """
+        Like _get_pages but yields each page as soon as it and every page
+        before it have arrived, with at most window pages requested ahead
+
+        Parameters:
+        url - The URL to GET
+        params_list - A list of parameter dictionaries, one for each request
+        window - (default None) Most pages requested ahead of the one being
+                 waited on, uses self.max_concurrency if None
+        """
+        window = window or self.max_concurrency
+        tasks = deque()
+        try:
+            for params in params_list:
+                tasks.append(ensure_future(self._request("GET", url, params=params)))
+                if len(tasks) >= window:
+                    yield await tasks.popleft()
+            while tasks:
+                yield await tasks.popleft()
+        finally:
+            # Don't fetch pages nobody will see if the caller stopped early
+            for task in tasks:
+                task.cancel()
+
+    async def _get_playlists(self):
+        """
+        Get the playlists of the current user (as determined by the token)
+        """
+        url = self.ME_URL + "playlists"
+        # Only allowed a maximum of 50 playlists at a time, the first page
+        # tells us how many there are in total
+        first_page = await self._request(
+            "GET", url, params={"limit": 50, "fields": self.PLAYLIST_FIELDS}
+        )
+        num_pl = first_page["total"]
+
+        params_list = [
+            {"limit": 50, "offset": offset * 50, "fields": self.PLAYLIST_FIELDS}
+            for offset in range(1, ceil(num_pl / 50))
+        ]
+        pages = [first_page] + await self._get_pages(url, params_list)
+
+        return User._parse_playlists(pages)
+
+    def _get_playlist(self, pl_id):
+        """
+        Returns the playlists.Playlist with an ID, making sure it exists
+        """
+        playlist = self.playlists.get(pl_id)
+        if playlist is None:
+            raise Exception(
+                "Playlist ID {} not found for user {}".format(pl_id, self.user)
+            )
+        return playlist
+
+    async def change_device(self, device_id):
+        """
+        Change the currently used device
+
+        Parameters:
+        device_id - The ID of the device to switch to
+        """
+        await self._request(
+            "PUT", self.ME_URL + "player", data=dumps({"device_ids": [device_id]})
+        )
+
+    async def get_available_devices(self):
+        """
+        Get the available devices of the current user
+        """
+        return (await self._request("GET", self.ME_URL + "player/devices"))["devices"]
+
+    async def play(self, data={}):
+        """
+        Plays the music, see User.play
+
+        Parameters:
+        data - (default {}) Song URIs to be passed to create a queue
+        """
+        await self._request("PUT", self.ME_URL + "player/play", data=dumps(data))
+
+    async def pause(self):
+        """
+        Pauses the music
+        """
+        await self._request("PUT", self.ME_URL + "player/pause")
+
+    async def get_playlist_songs(self, pl_id):
+        """
+        Returns a table.TrackTable of the songs in a playlist, in playlist
+        order, see User.get_playlist_songs
+
+        Parameters:
+        pl_id - The playlist id of the user to get the song data for
+        """
+        pl_len = self._get_playlist(pl_id).size
+        url = self.URL + "users/{}/playlists/{}/tracks".format(self.user, pl_id)
+
+        params_list = [
+            {"offset": offset * 100, "fields": self.TRACK_FIELDS}
+            for offset in range(ceil(pl_len / 100))
+        ]
+        pages = await self._get_pages(url, params_list)
+
+        return TrackTable(User._parse_songs(pages), self.library)
+
+    async def iter_playlist_songs(self, pl_id, window=None):
+        """
+        Yields (song, tuple of the artists, song ID) for each song in a
+        playlist in playlist order, page by page as the pages arrive. See
+        User.iter_playlist_songs
+
+        Parameters:
+        pl_id - The playlist id of the user to get the song data for
+        window - (default None) Most pages requested ahead of the one being
+                 waited on, uses self.max_concurrency if None
+        """
+        pl_len = self._get_playlist(pl_id).size
+        url = self.URL + "users/{}/playlists/{}/tracks".format(self.user, pl_id)
+
+        params_list = [
+            {"offset": offset * 100, "fields": self.TRACK_FIELDS}
+            for offset in range(ceil(pl_len / 100))
+        ]
+        async for page in self._iter_pages(url, params_list, window):
+            for song in User._parse_songs([page]):
+                yield song
+
+    async def create_queue(self, song_ids, new_queue=True, duplicate=False):
+        """
+        Given a list of song data, create a queue, see User.create_queue
+
+        Parameters:
+        song_ids - The song IDs to create the queue from
+        new_queue - (default True) If True, will create a new queue, else it
+                    will append to the previous queue
+        duplicate - (default False) If True, will add duplicate songs, else not
+        """
+        song_uris = (self.TRACK + song_id for song_id in song_ids)
+        if new_queue:
+            self.queue = SongQueue(song_uris, duplicate=True)
+        else:
+            self.queue.extend(song_uris, duplicate)
+        await self.play(data={"uris": self.queue.uris()})
+
+    async def create_playlist(self, songs, name, public=True):
+        """
+        Creates a playlist of songs.
+
+        Parameters:
+        songs - The song IDs to fill the playlist with
+        name - The name of the playlist
+        public - (default True) Decides whether the playlist is public (True)
+                 or private (False)
+        """
+        url = self.URL + "users/{}/playlists".format(self.user)
+        data = {"name": name, "public": public}
+        playlist = await self._request(
+            "POST", url, headers=self.JSON_HEADERS, data=dumps(data)
+        )
+        pl_id = playlist["id"]
+
+        self.playlists.add(Playlist(pl_id, name, playlist["snapshot_id"], self.user, 0))
+
+        await self._add_to_playlist(pl_id, songs)
+
+    async def _add_to_playlist(self, pl_id, songs):
+        """
+        Adds songs to a playlist and updates the info on the user's playlists.
+        This will add duplicates.
+
+        Parameters:
+        pl_id - The id of the playlist
+        songs - The song IDs to add
+        """
+        url = self.URL + "users/{}/playlists/{}/tracks".format(self.user, pl_id)
+        data = {"uris": [self.TRACK + song for song in songs]}
+        snapshot_id = (
+            await self._request(
+                "POST", url, headers=self.JSON_HEADERS, data=dumps(data)
+            )
+        )["snapshot_id"]
+
+        self.playlists.update(
+            pl_id,
+            size=self.playlists[pl_id].size + len(songs),
+            snapshot_id=snapshot_id,
+        )
+
+    async def delete_playlist(self, pl_id):
+        """
+        Deletes a playlist for a user by the playlist's id
+
+        Parameters:
+        pl_id - The id of the playlist to delete
+        """
+        url = self.URL + "users/{}/playlists/{}/followers".format(self.user, pl_id)
+        await self._request("DELETE", url)
+
+        self.playlists.remove(pl_id)
@@ -0,0 +1,128 @@
+from datetime import datetime as dt
+from threading import RLock, Timer
+
+
+class TokenProvider:
+    # Seconds to wait before trying again when a background refresh fails
+    RETRY_DELAY = 30
+
+    def __init__(self, refresh, access_token, token_birth, expires_in=3600, margin=300):
+        """
+        Holds the current access token and gets a new one in the background
+        margin seconds before it expires. Whoever uses the token subscribes
+        to be told about every new one, so that everything switches over to
+        it at once.
+
+        Parameters:
+        refresh - A function that gets a new token, returning a tuple of the
+                  access token, its datetime "birthdate" and the seconds it
+                  expires in
+        access_token - The current access token
+        token_birth - The datetime the current access token was made
+        expires_in - (default 3600) Seconds the current access token lasts
+        margin - (default 300) Seconds before expiring that the token is
+                 refreshed
+        """
+        self._refresh = refresh
+        self.margin = margin
+        self._lock = RLock()
+        self._listeners = []
+        self._timer = None
+        self._running = False
+        self._set_token(access_token, token_birth, expires_in)
+
+    def _set_token(self, access_token, token_birth, expires_in):
+        """
+        Stores a token, called with the lock held
+        """
+        self.access_token = access_token
+        self.token_birth = token_birth
+        self.expires_in = expires_in
+
+    def subscribe(self, callback):
+        """
+        Calls callback(access_token, token_birth) every time there's a new token
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stops calling a callback that was subscribed
+        """
+        with self._lock:
+            self._listeners.remove(callback)
+
+    def start(self):
+        """
+        Starts refreshing the token in the background ahead of it expiring
+        """
+        with self._lock:
+            self._running = True
+            self._schedule(self.expires_in - self.age() - self.margin)
+
+    def stop(self):
+        """
+        Stops refreshing the token in the background
+        """
+        with self._lock:
+            self._running = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def refresh(self, stale_token=None):
+        """
+        Gets a new token right away and hands it to the subscribers. If
+        stale_token is given and the token has already changed from it (e.g.
+        another thread got a 401 first), nothing is done.
+
+        Parameters:
+        stale_token - (default None) The token that was found not to work
+        """
+        with self._lock:
+            if stale_token is not None and stale_token != self.access_token:
+                return self.access_token
+
+            self._set_token(*self._refresh())
+            for callback in self._listeners:
+                callback(self.access_token, self.token_birth)
+
+            if self._running:
+                self._schedule(self.expires_in - self.margin)
+            return self.access_token
+
+    def _schedule(self, delay):
+        """
+        Sets the background refresh to happen in delay seconds
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = Timer(max(delay, 0), self._background_refresh)
+        # Don't keep the app alive just to refresh a token
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        """
+        Runs in the timer's thread to refresh the token
+        """
+        try:
+            self.refresh()
+        except Exception:
+            # Try again soon, a request getting a 401 will also try again
+            with self._lock:
+                if self._running:
+                    self._schedule(self.RETRY_DELAY)
+
+    def age(self):
+        """
+        Returns how many seconds old the current token is
+        """
+        return (dt.now() - self.token_birth).total_seconds()
+
+    def is_expired(self):
+        """
+        Determines whether or not the current token has expired
+        """
+        return self.age() > self.expires_in
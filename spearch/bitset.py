@@ -0,0 +1,54 @@
+"""
+Sets of song positions stored as the bits of a Python int, bit i being set if
+position i is in the set. AND, OR and NOT of whole sets are then single int
+operations instead of loops over every song.
+"""
+
+
+def from_positions(positions, size=None):
+    """
+    Returns the bitset of the given positions
+
+    Parameters:
+    positions - Any iterable of non-negative ints
+    size - (default None) A number larger than every position, found from the
+           positions if None
+    """
+    if size is None:
+        positions = list(positions)
+        if not positions:
+            return 0
+        size = max(positions) + 1
+
+    # Setting bits in a bytearray and converting once is far quicker than
+    # OR'ing each bit into an ever growing int
+    data = bytearray((size + 7) >> 3)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, "little")
+
+
+def full(size):
+    """
+    Returns the bitset of every position below size
+    """
+    return (1 << size) - 1
+
+
+def iter_bits(mask):
+    """
+    Yields the positions in a bitset in increasing order
+    """
+    # The binary string backwards has position i at index i
+    bits = bin(mask)[:1:-1]
+    position = bits.find("1")
+    while position != -1:
+        yield position
+        position = bits.find("1", position + 1)
+
+
+def count(mask):
+    """
+    Returns the number of positions in a bitset
+    """
+    return bin(mask).count("1")
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from json import dumps, loads
+from threading import Lock
+from time import monotonic
+import os.path as path, os, sqlite3, sys
+
+from tracks import Track
+
+
+def default_cache_dir():
+    """
+    The directory Spearch keeps its caches in, following each platform's
+    convention for per-user caches
+    """
+    if sys.platform == "win32":
+        root = os.environ.get("LOCALAPPDATA") or path.expanduser("~")
+        return path.join(root, "spearch", "Cache")
+    if sys.platform == "darwin":
+        return path.join(path.expanduser("~"), "Library", "Caches", "spearch")
+    root = os.environ.get("XDG_CACHE_HOME") or path.join(path.expanduser("~"), ".cache")
+    return path.join(root, "spearch")
+
+
+class TTLCache:
+    def __init__(self, maxsize=32, ttl=600):
+        """
+        A thread-safe in-memory mapping that holds at most maxsize entries,
+        evicting the least recently used one when full, and forgets entries
+        ttl seconds after they were set.
+
+        Parameters:
+        maxsize - (default 32) The most entries held at once
+        ttl - (default 600) Seconds an entry is kept for, None keeps them
+              until they are evicted
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = Lock()
+        # Maps key -> (expiry time, value), ordered least to most recently used
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Returns the value for key, or default if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] is not None and entry[0] <= monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        """
+        Sets the value for key, evicting the least recently used entry if full
+        """
+        expiry = None if self.ttl is None else monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Removes the entry for key if there is one
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class TrackCache:
+    FILE_NAME = "tracks.sqlite3"
+
+    def __init__(self, db_path=None):
+        """
+        A SQLite file which stores the songs of each playlist along with the
+        snapshot ID the playlist had when they were fetched. Spotify changes
+        the snapshot ID whenever a playlist is changed, so the stored songs
+        are only good while the snapshot IDs match. The connection is shared
+        between threads behind a lock.
+
+        Parameters:
+        db_path - (default None) The path to the SQLite file, it is made in
+                  default_cache_dir() if None
+        """
+        if db_path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            db_path = path.join(default_cache_dir(), self.FILE_NAME)
+        self.db_path = db_path
+
+        self._lock = Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS playlists (
+                    pl_id TEXT PRIMARY KEY,
+                    snapshot_id TEXT NOT NULL,
+                    songs TEXT NOT NULL
+                )
+                """
+            )
+
+    def get(self, pl_id, snapshot_id):
+        """
+        Returns the list of tracks.Track's stored for the playlist in
+        playlist order, or None if there's nothing stored for this snapshot
+        of the playlist
+
+        Parameters:
+        pl_id - The ID of the playlist
+        snapshot_id - The current snapshot ID of the playlist
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT songs FROM playlists WHERE pl_id = ? AND snapshot_id = ?",
+                (pl_id, snapshot_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return [Track.make(*song) for song in loads(row[0])]
+
+    def put(self, pl_id, snapshot_id, songs):
+        """
+        Stores the songs of a playlist, replacing any older snapshot of it
+
+        Parameters:
+        pl_id - The ID of the playlist
+        snapshot_id - The snapshot ID of the playlist the songs belong to
+        songs - The (song, tuple of the artists, song ID)'s in playlist order
+        """
+        # The normalized names are made again when loaded, so don't store them
+        songs = dumps([song[:3] for song in songs])
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO playlists VALUES (?, ?, ?)",
+                (pl_id, snapshot_id, songs),
+            )
+
+    def delete(self, pl_id):
+        """
+        Removes whatever is stored for a playlist
+
+        Parameters:
+        pl_id - The ID of the playlist
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM playlists WHERE pl_id = ?", (pl_id,))
+
+    def close(self):
+        """
+        Closes the connection to the SQLite file
+        """
+        with self._lock:
+            self._conn.close()
@@ -9,6 +9,9 @@ from selenium.common.exceptions import TimeoutException
 
 import requests
 
+from auth import TokenProvider
+from scheduler import RequestScheduler
+
 
 class Client:
     ROOT_URL = "https://accounts.spotify.com"
@@ -17,10 +20,16 @@ class Client:
     REDIRECT_URI = "https://duckduckgo.com/"
 
     def __init__(
-        self, user, scope=None, path_ini="client.ini", path_gd="geckodriver.exe"
+        self,
+        user,
+        scope=None,
+        path_ini="client.ini",
+        path_gd="geckodriver.exe",
+        scheduler=None,
     ):
         """
-        Gets a access token based on a user.
+        Gets a access token based on a user. The token is then kept fresh in
+        the background by self.token_provider, which User subscribes to.
 
         Parameters:
         user - The name of the Spotify user
@@ -33,11 +42,15 @@ class Client:
                    cached refresh tokens under USERNAME SCOPE
         path_gd - (default 'geckodriver.exe') The path to the geckodriver 
                   executable
+        scheduler - (default None) The scheduler.RequestScheduler requests
+                    are sent through, a new one is made if None. Pass it on
+                    to User so both are rate limited together
         """
         self.user = user
         self.path_ini = path_ini
         self.geckodriver_path = path_gd
         self.scope = scope or ""
+        self.scheduler = scheduler or RequestScheduler()
 
         # config stores the data from the .ini file
         self.config = ConfigParser()
@@ -46,29 +59,73 @@ class Client:
 
         self.access_token, self.token_birth = self.get_token()
 
+        # Keep the token fresh for as long as the app is open
+        self.token_provider = TokenProvider(
+            self._refresh_access_token, self.access_token, self.token_birth
+        )
+        self.token_provider.subscribe(self._set_token)
+        self.token_provider.start()
+
     def get_token(self):
         """
         Will get the access token and a time stamp of when it was made. If a
         refresh token exists for the user/scope combo, then use that to get
-        a new one. Otherwise, go through the whole process.
+        a new one. Otherwise, or if the refresh token no longer works, go
+        through the whole process.
         """
         # Checks to see if there already is a refresh token in the .ini file
         cache_section = self.user + " " + self.scope
         if cache_section in self.config.sections():
             # Takes it if so
-            self.refresh_token = self.config[cache_section].values()
-
-            # POSTs to get a new access token
-            data = {"grant_type": "refresh_token", "refresh_token": self.refresh_token}
-            auth = (self.client_id, self.client_secret)
-            token = requests.post(self.TOKEN_URL, data=data, auth=auth).json()
-
-            # Return current time as its "birthdate" to determine if expired
-            return token["access_token"], dt.now()
+            self.refresh_token = self.config[cache_section]["refresh_token"]
+
+            try:
+                access_token, token_birth, _ = self._refresh_access_token()
+                return access_token, token_birth
+            except requests.HTTPError:
+                # Revoked or already rotated, so log in again and cache the
+                # new one in its place
+                return self._request_token(secret=False)
         else:
             # Do everything fresh if not in cache (i.e. .ini file)
             return self._request_token()
 
+    def _request(self, method, url, **kwargs):
+        """
+        Sends a request through the scheduler. Raises requests.HTTPError if
+        the request still failed after any retries.
+        """
+        response = self.scheduler.request(requests, method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _refresh_access_token(self):
+        """
+        Uses the refresh token to get a new access token. Returns the access
+        token, its "birthdate" and the seconds until it expires.
+        """
+        # POSTs to get a new access token
+        data = {"grant_type": "refresh_token", "refresh_token": self.refresh_token}
+        auth = (self.client_id, self.client_secret)
+        token = self._request("POST", self.TOKEN_URL, data=data, auth=auth).json()
+
+        # Spotify may hand out a new refresh token, the old one then stops
+        # working so it replaces the one cached in the .ini file
+        refresh_token = token.get("refresh_token", self.refresh_token)
+        if refresh_token != self.refresh_token:
+            self.refresh_token = refresh_token
+            if self.user + " " + self.scope in self.config.sections():
+                self._cache_refresh_token()
+        # Return current time as its "birthdate" to determine if expired
+        return token["access_token"], dt.now(), token.get("expires_in", 3600)
+
+    def _set_token(self, access_token, token_birth):
+        """
+        Keeps the attributes up to date when the token provider refreshes
+        """
+        self.access_token = access_token
+        self.token_birth = token_birth
+
     def _request_auth_url(self):
         """
         Gets the URL for authenticating the user (URL where they will have
@@ -80,7 +137,7 @@ class Client:
             "redirect_uri": self.REDIRECT_URI,
             "scope": self.scope,
         }
-        return requests.get(self.REQUEST_URL, params=params).url
+        return self._request("GET", self.REQUEST_URL, params=params).url
 
     def _get_code(self):
         """
@@ -139,18 +196,25 @@ class Client:
             "grant_type": "authorization_code",
         }
         auth = (self.client_id, self.client_secret)
-        token = requests.post(self.TOKEN_URL, data=data, auth=auth).json()
+        token = self._request("POST", self.TOKEN_URL, data=data, auth=auth).json()
         access_token = token["access_token"]
         refresh_token = token["refresh_token"]
 
-        # Add another section to the .ini file to cache refresh token
-        if not secret:
-            section_name = self.user + " " + self.scope
-            self.config.add_section(section_name)
-            self.config.set(section_name, "refresh_token", refresh_token)
-            with open(self.path_ini, "w") as ini_file:
-                self.config.write(ini_file)
         self.refresh_token = refresh_token
+        if not secret:
+            self._cache_refresh_token()
 
         # Return the token and its "birthdate"
         return access_token, dt.now()
+
+    def _cache_refresh_token(self):
+        """
+        Writes the refresh token to the .ini file under USERNAME SCOPE, adding
+        the section if it isn't there yet
+        """
+        section_name = self.user + " " + self.scope
+        if section_name not in self.config.sections():
+            self.config.add_section(section_name)
+        self.config.set(section_name, "refresh_token", self.refresh_token)
+        with open(self.path_ini, "w") as ini_file:
+            self.config.write(ini_file)
@@ -0,0 +1,905 @@
+"""
+Compiles the filter specs of User.filter_playlist into a tree of predicates.
+A spec is compiled once and can then be used on any number of playlists, each
+song going through the tree a single time with AND/OR/NOT short-circuiting.
+Predicates compare the normalized names each Track carries against terms
+normalized the same way at compile time.
+
+A filter runs over a whole playlist at once. Each node of the tree is given a
+bitset (see the bitset module) of the songs still worth checking and returns
+the bitset of those that pass, so the AND, OR and NOT of the nodes are single
+int operations and a child is only asked about the songs its siblings haven't
+already decided. Given an index.TrackIndex, each predicate also narrows its
+songs down to the candidates from the trigram indexes before checking any.
+
+Every node estimates how much checking a song costs it and what fraction of
+songs pass it (its selectivity). ANDs run the cheap children that rule out the
+most songs first and ORs the cheap children that let the most songs through
+first, so the expensive ones see as few songs as possible. CompiledFilter's
+explain shows the plan this comes up with.
+"""
+
+from time import perf_counter
+
+from bitset import count, from_positions, full, iter_bits
+from fuzzy import distance
+from index import TrackIndex
+from matcher import MultiMatcher
+from table import TrackTable
+from tracks import as_track, normalize
+
+# Term lists at least this long are matched all at once by a MultiMatcher,
+# below it searching for each term on its own is quicker. Song names stop at
+# the first term found, often a common word, so they need more terms than
+# artists before the MultiMatcher is quicker
+MULTI_MATCH_NAME_TERMS = 64
+MULTI_MATCH_ARTIST_TERMS = 48
+
+# Rough costs of checking one song, relative to a set lookup
+HASH_COST = 1
+SUBSTRING_COST = 4
+MATCHER_COST = 40
+# Rough number of artists a song has
+ARTISTS_PER_SONG = 2
+# Rough fraction of songs that have a given artist or a given exact name
+ARTIST_SELECTIVITY = 0.01
+EXACT_SELECTIVITY = 0.001
+# Rough cost of an edit distance against a name, and fraction of names within
+# the distance of a term
+FUZZY_COST = 20
+FUZZY_SELECTIVITY = 0.002
+
+# Edits allowed by the fuzzy keywords unless a spec's _max_distance says
+DEFAULT_MAX_DISTANCE = 2
+
+
+def _term_selectivity(key):
+    """
+    Rough fraction of names a term is in, the longer the term the rarer
+    """
+    return 0.8 ** len(key)
+
+
+def _all_selectivity(selectivities):
+    """
+    Fraction passing when every one of some independent checks must pass
+    """
+    result = 1.0
+    for selectivity in selectivities:
+        result *= selectivity
+    return result
+
+
+def _any_selectivity(selectivities):
+    """
+    Fraction passing when any one of some independent checks must pass
+    """
+    return 1 - _all_selectivity(1 - selectivity for selectivity in selectivities)
+
+
+def _intersect(candidates):
+    """
+    Intersects bitsets of candidates, skipping the unknown ones (None). None
+    if every one is unknown.
+    """
+    result = None
+    for other in candidates:
+        if other is not None:
+            result = other if result is None else result & other
+    return result
+
+
+def _union(candidates):
+    """
+    Unions bitsets of candidates. None if any is unknown (it could be
+    anything).
+    """
+    result = 0
+    for other in candidates:
+        if other is None:
+            return None
+        result |= other
+    return result
+
+
+class Predicate:
+    """
+    A leaf of the tree, a single filtering keyword with its list of terms
+    """
+
+    KEYWORD = None
+    # The field of a Track the predicate looks at
+    FIELD = None
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        # Normalized once here like each Track's names are when it's made
+        self.keys = [normalize(term) for term in self.terms]
+        self.cost, self.selectivity = self.estimate()
+
+    def __call__(self, song):
+        return self.match(getattr(song, self.FIELD))
+
+    def estimate(self):
+        """
+        Returns the rough (cost, selectivity) of the predicate, the cost of
+        checking a song and the fraction of songs expected to pass
+        """
+        return SUBSTRING_COST * len(self.keys), 0.5
+
+    def match(self, value):
+        """
+        Whether a song whose FIELD is value passes
+        """
+        raise NotImplementedError
+
+    def candidates(self, index):
+        """
+        Returns the bitset of positions in a TrackIndex of the songs that
+        might pass, or None if it can't be narrowed down
+        """
+        return None
+
+    def mask(self, songs, within):
+        """
+        Returns the bitset of the positions in within whose songs pass
+
+        Parameters:
+        songs - A TrackIndex, a TrackTable or a list of Track's
+        within - Bitset of the positions to check
+        """
+        if isinstance(songs, TrackIndex):
+            candidates = self.candidates(songs)
+            if candidates is not None:
+                within &= candidates
+            songs = songs.tracks
+
+        match = self.match
+        if isinstance(songs, TrackTable):
+            # Only the one column is read, no Track's are made
+            passed = (
+                position
+                for position, value in songs.values(self.FIELD, iter_bits(within))
+                if match(value)
+            )
+        else:
+            field = self.FIELD
+            passed = (
+                position
+                for position in iter_bits(within)
+                if match(getattr(songs[position], field))
+            )
+        return from_positions(passed, len(songs))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.KEYWORD, self.terms)
+
+
+class ArtistsAnd(Predicate):
+    """
+    Every term must be an artist of the song
+    """
+
+    KEYWORD = "artists_and"
+    FIELD = "artist_keys"
+
+    def match(self, artists):
+        return all(key in artists for key in self.keys)
+
+    def estimate(self):
+        return (
+            HASH_COST * len(self.keys),
+            ARTIST_SELECTIVITY ** len(self.keys),
+        )
+
+    def candidates(self, index):
+        return _intersect(index.artist_candidates(key) for key in self.keys)
+
+
+class ArtistsOr(Predicate):
+    """
+    At least one term must be an artist of the song
+    """
+
+    KEYWORD = "artists_or"
+    FIELD = "artist_keys"
+
+    def __init__(self, terms):
+        super().__init__(terms)
+        self.keys = set(self.keys)
+
+    def match(self, artists):
+        # Looks up each artist instead of going through every term
+        return not self.keys.isdisjoint(artists)
+
+    def estimate(self):
+        return (
+            HASH_COST * ARTISTS_PER_SONG,
+            min(1, ARTIST_SELECTIVITY * len(self.keys)),
+        )
+
+    def candidates(self, index):
+        return _union(index.artist_candidates(key) for key in self.keys)
+
+
+class ArtistAnd(Predicate):
+    """
+    At least one artist of the song must have every term in their name
+    """
+
+    KEYWORD = "artist_and"
+    FIELD = "artist_keys"
+
+    def match(self, artists):
+        return any(all(key in artist for key in self.keys) for artist in artists)
+
+    def estimate(self):
+        per_artist = _all_selectivity(map(_term_selectivity, self.keys))
+        return (
+            SUBSTRING_COST * len(self.keys) * ARTISTS_PER_SONG,
+            _any_selectivity([per_artist] * ARTISTS_PER_SONG),
+        )
+
+    def candidates(self, index):
+        # Every term on some artist means every term on the song's artists
+        return _intersect(index.artist_candidates(key) for key in self.keys)
+
+
+class ArtistOr(Predicate):
+    """
+    At least one artist of the song must have at least one term in their name
+    """
+
+    KEYWORD = "artist_or"
+    FIELD = "artist_keys"
+
+    def __init__(self, terms):
+        super().__init__(terms)
+        self.matcher = None
+        if len(self.keys) >= MULTI_MATCH_ARTIST_TERMS:
+            self.matcher = MultiMatcher(self.keys)
+
+    def match(self, artists):
+        if self.matcher is not None:
+            return any(self.matcher.search(artist) for artist in artists)
+        return any(any(key in artist for key in self.keys) for artist in artists)
+
+    def estimate(self):
+        per_artist = _any_selectivity(map(_term_selectivity, self.keys))
+        if len(self.keys) >= MULTI_MATCH_ARTIST_TERMS:
+            cost = MATCHER_COST
+        else:
+            cost = SUBSTRING_COST * len(self.keys)
+        return (
+            cost * ARTISTS_PER_SONG,
+            _any_selectivity([per_artist] * ARTISTS_PER_SONG),
+        )
+
+    def candidates(self, index):
+        return _union(index.artist_candidates(key) for key in self.keys)
+
+
+class SongExact(Predicate):
+    """
+    The song name must be exactly one of the terms
+    """
+
+    KEYWORD = "song_exact"
+    FIELD = "name_key"
+
+    def __init__(self, terms):
+        super().__init__(terms)
+        self.keys = set(self.keys)
+
+    def match(self, name):
+        return name in self.keys
+
+    def estimate(self):
+        return HASH_COST, min(1, EXACT_SELECTIVITY * len(self.keys))
+
+    def candidates(self, index):
+        # Straight from the index's table of exact names, never a scan
+        return _union(index.exact_name_candidates(key) for key in self.keys)
+
+
+class SongAnd(Predicate):
+    """
+    The song name must have every term in it
+    """
+
+    KEYWORD = "song_and"
+    FIELD = "name_key"
+
+    def match(self, name):
+        return all(key in name for key in self.keys)
+
+    def estimate(self):
+        return (
+            SUBSTRING_COST * len(self.keys),
+            _all_selectivity(map(_term_selectivity, self.keys)),
+        )
+
+    def candidates(self, index):
+        return _intersect(index.name_candidates(key) for key in self.keys)
+
+
+class SongOr(Predicate):
+    """
+    The song name must have at least one term in it
+    """
+
+    KEYWORD = "song_or"
+    FIELD = "name_key"
+
+    def __init__(self, terms):
+        super().__init__(terms)
+        self.matcher = None
+        if len(self.keys) >= MULTI_MATCH_NAME_TERMS:
+            self.matcher = MultiMatcher(self.keys)
+
+    def match(self, name):
+        if self.matcher is not None:
+            return self.matcher.search(name)
+        return any(key in name for key in self.keys)
+
+    def estimate(self):
+        if len(self.keys) >= MULTI_MATCH_NAME_TERMS:
+            cost = MATCHER_COST
+        else:
+            cost = SUBSTRING_COST * len(self.keys)
+        return cost, _any_selectivity(map(_term_selectivity, self.keys))
+
+    def candidates(self, index):
+        return _union(index.name_candidates(key) for key in self.keys)
+
+
+class FuzzyPredicate(Predicate):
+    """
+    A predicate matching names within max_distance edits of its terms, so
+    typos and missing accents still match
+    """
+
+    def __init__(self, terms, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        super().__init__(terms)
+        self.keys = set(self.keys)
+        # Whether each name seen is near a term, songs share a lot of names
+        self._near_names = {}
+
+    def near(self, name):
+        """
+        Whether a normalized name is within max_distance edits of any term
+        """
+        near = self._near_names.get(name)
+        if near is None:
+            near = self._near_names[name] = any(
+                distance(key, name, self.max_distance) <= self.max_distance
+                for key in self.keys
+            )
+        return near
+
+    def __repr__(self):
+        return "{}({!r}, max_distance={})".format(
+            self.KEYWORD, self.terms, self.max_distance
+        )
+
+
+class SongFuzzy(FuzzyPredicate):
+    """
+    The song name must be within max_distance edits of one of the terms
+    """
+
+    KEYWORD = "song_fuzzy"
+    FIELD = "name_key"
+
+    def match(self, name):
+        return self.near(name)
+
+    def estimate(self):
+        return FUZZY_COST, min(1, FUZZY_SELECTIVITY * len(self.keys))
+
+    def candidates(self, index):
+        # Found with the index's BK-tree instead of checking every song, once
+        # the tree is made
+        return _union(
+            index.fuzzy_name_candidates(key, self.max_distance) for key in self.keys
+        )
+
+
+class ArtistFuzzy(FuzzyPredicate):
+    """
+    An artist of the song must be within max_distance edits of one of the
+    terms
+    """
+
+    KEYWORD = "artist_fuzzy"
+    FIELD = "artist_keys"
+
+    def match(self, artists):
+        return any(self.near(artist) for artist in artists)
+
+    def estimate(self):
+        return (
+            FUZZY_COST * ARTISTS_PER_SONG,
+            min(1, ARTIST_SELECTIVITY * len(self.keys)),
+        )
+
+    def candidates(self, index):
+        return _union(
+            index.fuzzy_artist_candidates(key, self.max_distance) for key in self.keys
+        )
+
+
+# The filtering keywords and the predicate each one compiles to
+KEYWORDS = {
+    predicate.KEYWORD: predicate
+    for predicate in [
+        ArtistsAnd,
+        ArtistsOr,
+        ArtistAnd,
+        ArtistOr,
+        SongExact,
+        SongAnd,
+        SongOr,
+        SongFuzzy,
+        ArtistFuzzy,
+    ]
+}
+
+
+class And:
+    """
+    True if every child is, stopping at the first that isn't
+    """
+
+    def __init__(self, children):
+        # Cheap children that rule out the most songs first
+        self.children = sorted(
+            children, key=lambda child: child.cost / max(1 - child.selectivity, 1e-9)
+        )
+        # Each child only pays for the songs the ones before it let through
+        self.cost, self.selectivity = 0, 1
+        for child in self.children:
+            self.cost += self.selectivity * child.cost
+            self.selectivity *= child.selectivity
+
+    def __call__(self, song):
+        for child in self.children:
+            if not child(song):
+                return False
+        return True
+
+    def mask(self, songs, within):
+        # Each child only checks the songs every child before it let through
+        for child in self.children:
+            if not within:
+                break
+            within = child.mask(songs, within)
+        return within
+
+    def __repr__(self):
+        return "And({})".format(", ".join(map(repr, self.children)))
+
+
+class Or:
+    """
+    True if any child is, stopping at the first that is
+    """
+
+    def __init__(self, children):
+        # Cheap children that let the most songs through first
+        self.children = sorted(
+            children, key=lambda child: child.cost / max(child.selectivity, 1e-9)
+        )
+        # Each child only pays for the songs the ones before it didn't let
+        # through
+        self.cost, failing = 0, 1
+        for child in self.children:
+            self.cost += failing * child.cost
+            failing *= 1 - child.selectivity
+        self.selectivity = 1 - failing
+
+    def __call__(self, song):
+        for child in self.children:
+            if child(song):
+                return True
+        return False
+
+    def mask(self, songs, within):
+        # Each child only checks the songs no child before it let through
+        result = 0
+        for child in self.children:
+            rest = within & ~result
+            if not rest:
+                break
+            result |= child.mask(songs, rest)
+        return result
+
+    def __repr__(self):
+        return "Or({})".format(", ".join(map(repr, self.children)))
+
+
+class Not:
+    """
+    True if the child isn't
+    """
+
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+        self.selectivity = 1 - child.selectivity
+
+    def __call__(self, song):
+        return not self.child(song)
+
+    def mask(self, songs, within):
+        return within & ~self.child.mask(songs, within)
+
+    def __repr__(self):
+        return "Not({!r})".format(self.child)
+
+
+class CompiledFilter:
+    def __init__(self, root):
+        """
+        A compiled filter spec, made by compile_filter. Calling it on a song
+        says whether the song passes the filter. Songs are expected to be
+        tracks.Track's, plain tuples are turned into them first.
+
+        Parameters:
+        root - The predicate tree
+        """
+        self.root = root
+
+    def __call__(self, song):
+        return self.root(as_track(song))
+
+    def mask(self, songs, within=None):
+        """
+        Returns the bitset of the positions of the songs that pass the filter
+
+        Parameters:
+        songs - A TrackIndex, a TrackTable or a list of Track's
+        within - (default None) Bitset of the positions to check, every song
+                 if None
+        """
+        if within is None:
+            within = _every(songs)
+        return self.root.mask(songs, within)
+
+    def filter(self, songs):
+        """
+        Returns the songs that pass the filter, in the order given. If songs
+        is a table.TrackTable or an index.TrackIndex, they're given back as a
+        TrackTable of the same rows, otherwise as a list. If songs is a
+        TrackIndex, only the songs its indexes say might pass are checked.
+
+        Parameters:
+        songs - Any iterable of songs in the format of get_playlist_songs
+        """
+        if isinstance(songs, TrackTable):
+            return songs.select(self.mask(songs))
+        if isinstance(songs, TrackIndex):
+            return songs.tracks.select(self.mask(songs))
+
+        # Hand back the songs as given, even if they weren't Track's
+        songs = list(songs)
+        mask = self.mask([as_track(song) for song in songs])
+        return [songs[position] for position in iter_bits(mask)]
+
+    def explain(self, songs=None):
+        """
+        Returns the plan of the filter as text, a line per node in the order
+        they run with its estimated cost and selectivity. If songs are given,
+        the filter is run on them and each line also says how many songs the
+        node checked, how many passed and how long it took.
+
+        Parameters:
+        songs - (default None) The songs to run the filter on, like filter
+        """
+        stats = {}
+        if songs is not None:
+            if not isinstance(songs, (TrackIndex, TrackTable)):
+                songs = [as_track(song) for song in songs]
+            _profile(self.root, songs, _every(songs), stats)
+
+        lines = []
+        _explain(self.root, 0, stats, lines)
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "CompiledFilter({!r})".format(self.root)
+
+
+def _every(songs):
+    """
+    The bitset of every song in a TrackIndex, a TrackTable or a list
+    """
+    if isinstance(songs, TrackIndex):
+        return songs.live()
+    return full(len(songs))
+
+
+def _profile(node, songs, within, stats):
+    """
+    Runs a node's mask like its own mask method would, keeping the number of
+    songs it checked, the number that passed and the seconds it took in stats
+    under the node's id
+    """
+    start = perf_counter()
+    if isinstance(node, And):
+        result = within
+        for child in node.children:
+            if not result:
+                break
+            result = _profile(child, songs, result, stats)
+    elif isinstance(node, Or):
+        result = 0
+        for child in node.children:
+            rest = within & ~result
+            if not rest:
+                break
+            result |= _profile(child, songs, rest, stats)
+    elif isinstance(node, Not):
+        result = within & ~_profile(node.child, songs, within, stats)
+    else:
+        result = node.mask(songs, within)
+    stats[id(node)] = (count(within), count(result), perf_counter() - start)
+    return result
+
+
+def _explain(node, depth, stats, lines):
+    """
+    Adds the lines describing a node and its children to lines
+    """
+    if isinstance(node, (And, Or, Not)):
+        label = type(node).__name__.upper()
+    else:
+        label = repr(node)
+    line = "{}{}  cost {:.1f}, selectivity {:.3g}".format(
+        "    " * depth, label, node.cost, node.selectivity
+    )
+    if id(node) in stats:
+        checked, passed, seconds = stats[id(node)]
+        line += ", checked {}, passed {}, {:.1f} ms".format(
+            checked, passed, seconds * 1000
+        )
+    lines.append(line)
+
+    children = [node.child] if isinstance(node, Not) else getattr(node, "children", [])
+    for child in children:
+        _explain(child, depth + 1, stats, lines)
+
+
+def compile_filter(spec=None, **kwargs):
+    """
+    Compiles a filter spec into a CompiledFilter. The spec is the keyword
+    arguments of User.filter_playlist, given either as a dictionary or as
+    keyword arguments (or both). Like there, the top level is OR'd.
+
+    Parameters:
+    spec - (default None) Dictionary of _and, _or, _not and filtering keywords
+    kwargs - More of the spec, added to the dictionary
+    """
+    return CompiledFilter(_compile_group(dict(spec or {}, **kwargs), or_logic=True))
+
+
+def canonical_spec(spec=None, **kwargs):
+    """
+    Returns a hashable form of a filter spec (see compile_filter) that's the
+    same for every spec that filters the same way but is written differently,
+    e.g. with the keywords, terms or nested groups in another order, the
+    terms in another case or a term repeated. Used to cache filter results.
+
+    Parameters:
+    spec - (default None) Dictionary of _and, _or, _not and filtering keywords
+    kwargs - More of the spec, added to the dictionary
+    """
+    return _canonical_group(dict(spec or {}, **kwargs), DEFAULT_MAX_DISTANCE)
+
+
+def _canonical_group(spec, max_distance):
+    """
+    The canonical form of one level of a spec, a tuple of whether it's NOT'd,
+    its keywords with their sorted normalized terms (and max distance if
+    fuzzy, else None), and its nested _or and _and groups, each sorted
+    """
+    spec = dict(spec)
+    _and = spec.pop("_and", None)
+    _or = spec.pop("_or", None)
+    _not = bool(spec.pop("_not", False))
+    max_distance = spec.pop("_max_distance", max_distance)
+
+    if isinstance(_and, dict):
+        _and = [_and]
+    if isinstance(_or, dict):
+        _or = [_or]
+
+    keywords = tuple(
+        sorted(
+            (
+                keyword,
+                tuple(sorted({normalize(term) for term in terms})),
+                max_distance if _is_fuzzy(keyword) else None,
+            )
+            for keyword, terms in spec.items()
+        )
+    )
+    ors = tuple(sorted(_canonical_group(_or_n, max_distance) for _or_n in _or or []))
+    ands = tuple(
+        sorted(_canonical_group(_and_n, max_distance) for _and_n in _and or [])
+    )
+    return (_not, keywords, ors, ands)
+
+
+def _is_fuzzy(keyword):
+    """
+    Whether a filtering keyword is one of the fuzzy ones
+    """
+    return keyword in KEYWORDS and issubclass(KEYWORDS[keyword], FuzzyPredicate)
+
+
+def _compile_group(spec, or_logic, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Compiles one level of a spec, whose members are OR'd if or_logic and
+    AND'd otherwise. Nested _or and _and dictionaries (or lists of them)
+    become their own groups. A _max_distance sets the edits the fuzzy
+    keywords allow for the level and the levels nested in it.
+    """
+    spec = dict(spec)
+    _and = spec.pop("_and", None)
+    _or = spec.pop("_or", None)
+    _not = spec.pop("_not", False)
+    max_distance = spec.pop("_max_distance", max_distance)
+
+    # Turn them into lists even if just one
+    if isinstance(_and, dict):
+        _and = [_and]
+    if isinstance(_or, dict):
+        _or = [_or]
+
+    children = [_compile_group(_or_n, True, max_distance) for _or_n in _or or []]
+    children += [_compile_group(_and_n, False, max_distance) for _and_n in _and or []]
+    for keyword, terms in spec.items():
+        if keyword not in KEYWORDS:
+            raise Exception("Unknown filter keyword {}".format(keyword))
+        if _is_fuzzy(keyword):
+            children.append(KEYWORDS[keyword](terms, max_distance))
+        else:
+            children.append(KEYWORDS[keyword](terms))
+
+    # An empty OR lets nothing through and an empty AND lets everything through
+    group = Or(children) if or_logic else And(children)
+    return Not(group) if _not else group
+
+
+class FilterSession:
+    def __init__(self, songs):
+        """
+        Filters the same songs over and over as the filter is edited, e.g.
+        searching as the user types. When a new filter is narrower than the
+        last one, every song passing it must have passed the last one too, so
+        only the last result (and any songs added to the end of a table or
+        index since) is checked. Otherwise every song is. Narrower
+        is found from the specs alone and errs on the side of checking every
+        song, e.g. adding a term to an AND or typing more of a song_and term
+        is narrower, while dropping one isn't.
+
+        Parameters:
+        songs - The songs to filter, a TrackTable, an index.TrackIndex or any
+                iterable of songs
+        """
+        if not isinstance(songs, (TrackIndex, TrackTable)):
+            songs = [as_track(song) for song in songs]
+        self.songs = songs
+        self._tree = None
+        self._mask = None
+        self._size = 0
+
+    def filter(self, spec=None, **kwargs):
+        """
+        Returns the songs that pass a filter like CompiledFilter.filter,
+        checking only the last result if the filter is narrower than the last
+
+        Parameters:
+        spec - (default None) Dictionary of _and, _or, _not and filtering
+               keywords
+        kwargs - More of the spec, added to the dictionary
+        """
+        spec = dict(spec or {}, **kwargs)
+        compiled = compile_filter(spec)
+        tree = _logic_tree(canonical_spec(spec), or_logic=True)
+
+        size = _size(self.songs)
+        within = None
+        if self._tree is not None and _implies(tree, self._tree):
+            # The songs may have been added to since (see User._add_to_playlist)
+            # and the last result knows nothing about the new ones
+            within = self._mask | (full(size) & ~full(self._size))
+            within &= _every(self.songs)
+        self._tree = tree
+        self._size = size
+        self._mask = compiled.mask(self.songs, within)
+
+        if isinstance(self.songs, TrackTable):
+            return self.songs.select(self._mask)
+        if isinstance(self.songs, TrackIndex):
+            return self.songs.tracks.select(self._mask)
+        return [self.songs[position] for position in iter_bits(self._mask)]
+
+    def reset(self):
+        """
+        Forgets the last filter so the next one checks every song
+        """
+        self._tree = None
+        self._mask = None
+        self._size = 0
+
+
+def _size(songs):
+    """
+    The number of positions in a TrackIndex, a TrackTable or a list
+    """
+    if isinstance(songs, TrackIndex):
+        return len(songs.tracks)
+    return len(songs)
+
+
+def _logic_tree(group, or_logic):
+    """
+    Turns a canonical_spec group into a tree of ('or', children),
+    ('and', children), ('not', child) and ('pred', keyword, keys, max
+    distance) tuples,
+    dropping ORs and ANDs of a single child
+    """
+    _not, keywords, ors, ands = group
+    children = [("pred",) + keyword for keyword in keywords]
+    children += [_logic_tree(_or_n, or_logic=True) for _or_n in ors]
+    children += [_logic_tree(_and_n, or_logic=False) for _and_n in ands]
+
+    if len(children) == 1:
+        node = children[0]
+    else:
+        node = ("or" if or_logic else "and", tuple(children))
+    return ("not", node) if _not else node
+
+
+def _implies(new, old):
+    """
+    Whether every song passing the _logic_tree new must pass old too. False
+    when it can't tell.
+    """
+    if new == old:
+        return True
+    if new[0] == "not" and old[0] == "not":
+        return _implies(old[1], new[1])
+    if old[0] == "and":
+        return all(_implies(new, child) for child in old[1])
+    if new[0] == "or":
+        return all(_implies(child, old) for child in new[1])
+    if new[0] == "and" and any(_implies(child, old) for child in new[1]):
+        return True
+    if old[0] == "or" and any(_implies(new, child) for child in old[1]):
+        return True
+    if new[0] == "pred" and old[0] == "pred" and new[1] == old[1]:
+        return _pred_implies(new[1], new[2], old[2], new[3], old[3])
+    return False
+
+
+def _pred_implies(keyword, new_keys, old_keys, new_distance, old_distance):
+    """
+    Whether a predicate with new_keys implies the same predicate with old_keys
+    """
+    if _is_fuzzy(keyword):
+        return new_distance <= old_distance and set(new_keys) <= set(old_keys)
+    if keyword in ("song_and", "artist_and"):
+        # Each old term is in a new term, so in the name with it
+        return all(any(old in new for new in new_keys) for old in old_keys)
+    if keyword in ("song_or", "artist_or"):
+        # Whichever new term is in the name has an old term in it
+        return all(any(old in new for old in old_keys) for new in new_keys)
+    if keyword == "artists_and":
+        return set(new_keys) >= set(old_keys)
+    if keyword in ("artists_or", "song_exact"):
+        return set(new_keys) <= set(old_keys)
+    return False
@@ -0,0 +1,113 @@
+"""
+Edit distance between names and a BK-tree to find every name within some
+distance of a term without working out the distance to every name.
+"""
+
+
+def distance(a, b, max_distance=None):
+    """
+    Returns the Levenshtein distance between two strings, the fewest single
+    character insertions, deletions and substitutions turning one into the
+    other. Worked out a column at a time with the column held in the bits of
+    ints (Myers' bit-vector algorithm), so each character of b only takes a
+    handful of int operations.
+
+    Parameters:
+    a, b - The strings
+    max_distance - (default None) If given, gives up as soon as the distance
+                   is known to be over it and returns max_distance + 1
+    """
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if not a:
+        return len(b)
+
+    # Bit i of peq[char] is set if a[i] is char
+    peq = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | 1 << i
+
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    # Bits of the vertical differences of the column going up (pos) or down
+    pos, neg = full, 0
+    score = len(a)
+    for done, char in enumerate(b, 1):
+        eq = peq.get(char, 0)
+        x_v = eq | neg
+        x_h = (((eq & pos) + pos) ^ pos) | eq
+        h_pos = neg | (full & ~(x_h | pos))
+        h_neg = pos & x_h
+        if h_pos & last:
+            score += 1
+        elif h_neg & last:
+            score -= 1
+        # Each character left can only take the distance down by one
+        if max_distance is not None and score - (len(b) - done) > max_distance:
+            return max_distance + 1
+        h_pos = (h_pos << 1 | 1) & full
+        h_neg = (h_neg << 1) & full
+        pos = h_neg | (full & ~(x_v | h_pos))
+        neg = h_pos & x_v
+    return score
+
+
+class BKTree:
+    def __init__(self, keys=()):
+        """
+        A tree of strings where each child hangs off its parent by their edit
+        distance. By the triangle inequality, a search only needs to go down
+        the children whose distance is within max_distance of the term's
+        distance to their parent, skipping most of the tree.
+
+        Parameters:
+        keys - (default ()) The strings to start with
+        """
+        # Each node is (key, dictionary of distance -> child node)
+        self.root = None
+        self._size = 0
+        for key in keys:
+            self.add(key)
+
+    def add(self, key):
+        """
+        Adds a string to the tree if it isn't already in it
+        """
+        if self.root is None:
+            self.root = (key, {})
+            self._size += 1
+            return
+
+        node = self.root
+        while True:
+            dist = distance(key, node[0])
+            if dist == 0:
+                return
+            child = node[1].get(dist)
+            if child is None:
+                node[1][dist] = (key, {})
+                self._size += 1
+                return
+            node = child
+
+    def search(self, term, max_distance):
+        """
+        Returns the list of strings in the tree within max_distance of term
+        """
+        found = []
+        if self.root is None:
+            return found
+
+        nodes = [self.root]
+        while nodes:
+            key, children = nodes.pop()
+            dist = distance(term, key)
+            if dist <= max_distance:
+                found.append(key)
+            for child_dist, child in children.items():
+                if dist - max_distance <= child_dist <= dist + max_distance:
+                    nodes.append(child)
+        return found
+
+    def __len__(self):
+        return self._size
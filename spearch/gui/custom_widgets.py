@@ -1,4 +1,5 @@
 from PyQt5.QtWidgets import (
+    QComboBox,
     QTableWidget,
     QAbstractItemView,
     QHeaderView,
@@ -41,6 +42,41 @@ class SimpleFilterArtistsTable(QTableWidget):
             self.menu.exec_(event.globalPos())
 
 
+class PlaylistComboBox(QComboBox):
+    def __init__(self, playlists, parent=None):
+        """
+        A QComboBox of the user's playlists that shows their names and keeps
+        their IDs as the item data, so the chosen playlist's ID is just
+        currentData(). It keeps itself up to date as playlists are made,
+        renamed and deleted.
+
+        Parameters:
+        playlists - The user's playlists.PlaylistRegistry
+        parent - (default None) Parent this widget.
+        """
+        super().__init__(parent)
+        self.registry = playlists
+        for playlist in playlists:
+            self.addItem(playlist.name, playlist.id)
+
+        playlists.subscribe(self._playlist_changed)
+        # Stop listening once the combobox is gone
+        callback = self._playlist_changed
+        self.destroyed.connect(lambda: playlists.unsubscribe(callback))
+
+    def _playlist_changed(self, event, playlist):
+        """
+        Adds, renames or removes the item of a playlist that's changed
+        """
+        ind = self.findData(playlist.id)
+        if event == self.registry.ADDED and ind == -1:
+            self.addItem(playlist.name, playlist.id)
+        elif event == self.registry.UPDATED and ind != -1:
+            self.setItemText(ind, playlist.name)
+        elif event == self.registry.REMOVED and ind != -1:
+            self.removeItem(ind)
+
+
 class SongDataTableWidget(QTableWidget):
     def __init__(self, selectable, sortable, parent=None):
         """
@@ -8,6 +8,7 @@ sys.path.insert(0, cur_dir[: cur_dir.rfind(path.sep)])
 from functools import partial
 
 from PyQt5.QtWidgets import (
+    QMessageBox,
     QMainWindow,
     QAction,
     QWidget,
@@ -20,6 +21,7 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import Qt
+from requests import HTTPError
 
 from tabs import (
     PlaylistSongsUI,
@@ -29,11 +31,29 @@ from tabs import (
 )
 from popups import Login
 from user import User
+from cache import TrackCache
 from style import TabStyle, BG_COLOR
 
 sys.path.pop(0)
 
 
+def show_player_error(parent, error):
+    """
+    Tells the user a player request failed, e.g. with a 404 when there's no
+    active device to play on, instead of letting the error close the app
+
+    Parameters:
+    parent - The widget the message box belongs to
+    error - The requests.HTTPError raised
+    """
+    message = str(error)
+    try:
+        message = error.response.json()["error"]["message"]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        pass
+    QMessageBox.warning(parent, "Spotify Player", message)
+
+
 class Window(QMainWindow):
     NEW_USER_EXIT_CODE = 322
     BOLD_FONT = QFont()
@@ -51,7 +71,14 @@ class Window(QMainWindow):
 
         # Get the backend data
         self.client = client
-        self.user = User(self.client.access_token, self.client.token_birth)
+        self.user = User(
+            self.client.access_token,
+            self.client.token_birth,
+            track_cache=TrackCache(),
+            scheduler=self.client.scheduler,
+            token_provider=self.client.token_provider,
+            index_songs=True,
+        )
 
         self.init_ui(max_height, max_width)
         self.init_menu()
@@ -184,7 +211,11 @@ class Window(QMainWindow):
         Changes the device by using the User change_device method and then
         resetting the available devices.
         """
-        self.user.change_device(device_id)
+        try:
+            self.user.change_device(device_id)
+        except HTTPError as error:
+            show_player_error(self, error)
+            return
         self._reset_avail_devices(device_id)
 
     def _relogin(self):
@@ -196,6 +227,8 @@ class Window(QMainWindow):
         result = login.exec_()
 
         if result == QDialog.Accepted:
+            # The old user's token isn't needed anymore
+            self.client.token_provider.stop()
             self.client = login.client
             # Exit current app with code that tells main loop to repeat
             qApp.exit(self.NEW_USER_EXIT_CODE)
@@ -260,4 +293,8 @@ class Tabs(QWidget):
             song_id = QTableWidgetItem(self.createq_tab.queue_list.item(row, 2).text())
             song_ids.append(song_id.text())
 
-        self.user.create_queue(song_ids)
+        # Nothing can be played if there's no active device
+        try:
+            self.user.create_queue(song_ids)
+        except HTTPError as error:
+            show_player_error(self, error)
@@ -15,7 +15,12 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import Qt
 
-from custom_widgets import SimpleFilterArtistsTable, SongDataTableWidget, WidgetGroupBox
+from custom_widgets import (
+    PlaylistComboBox,
+    SimpleFilterArtistsTable,
+    SongDataTableWidget,
+    WidgetGroupBox,
+)
 from popups import NewPlaylistDialog
 from style import (
     PlaylistSongsStyle,
@@ -38,7 +43,7 @@ class PlaylistSongsUI(QWidget):
 
         # Display the songs of a playlist that is selected from the combo box
         self.playlists.currentIndexChanged.connect(
-            lambda: self.add_songs(self.user.pl_ids[self.playlists.currentIndex()])
+            lambda: self.add_songs(self.playlists.currentData())
         )
 
     def init_ui(self):
@@ -48,11 +53,9 @@ class PlaylistSongsUI(QWidget):
         self.songs_table.setFocusPolicy(Qt.NoFocus)
 
         # Create list for selection of playlists
-        self.playlists = QComboBox(self)
-        # Add playlists to the combo box
-        self.playlists.addItems(self.user.playlists)
+        self.playlists = PlaylistComboBox(self.user.playlists, self)
         # Init add all the songs of the first playlist
-        self.add_songs(self.user.pl_ids[0])
+        self.add_songs(self.playlists.currentData())
 
         # Create button to add songs to queue
         self.add_songs_button = QPushButton("Add", self)
@@ -147,13 +150,10 @@ class AdvFilterPlaylistsUI(QWidget):
                 if len(data[logic]) == 1:
                     filt_dict[playlist].pop(logic)
 
-        filt_songs = []
-        # Run through each playlist and filter them
-        for playlist, data in filt_dict.items():
-            songs = self.user.get_playlist_songs(
-                self.user.pl_ids[self.user.playlists.index(playlist)]
-            )
-            filt_songs += self.user.filter_playlist(songs, _or=data)
+        # Filter every playlist at once, each with its own filter
+        filt_songs = self.user.filter_playlists(
+            {pl_id: dict(_or=data) for pl_id, data in filt_dict.items()}
+        )
 
         # Add songs to the table
         self.songs_table.add_songs(filt_songs, True)
@@ -168,7 +168,7 @@ class AdvFilterPlaylistsUI(QWidget):
         This works since each important part of the layout is a separate and
         nested layout. So there's the parent one. Then a playlist layout, a
         nested logic layout and a nested (in the logic layout) filter layout.
-        Playlist just means the name of the playlist. Logic is whether it's
+        Playlist just means the ID of the playlist chosen. Logic is whether it's
         an AND or an OR. And filter is the filter choice of which there are
         seven described under User.filter_playlist. These are stored in a
         dictionary passed along which is returned at the end.
@@ -179,7 +179,7 @@ class AdvFilterPlaylistsUI(QWidget):
                 called which allows us to know what Combobox has been reached
         filt_dict - (default None) The main dictionary that stores all of the
                     parsed data
-        pl - (default None) The last playlist name used so that it can
+        pl - (default None) The last playlist ID used so that it can
                     be called in the dictionary for adding data
         logic - (default None) The last type of logic used like latest_pl
         """
@@ -213,11 +213,11 @@ class AdvFilterPlaylistsUI(QWidget):
                     )
                 # And if it's a combobox...
                 elif isinstance(widget, QComboBox):
-                    # Depth 1 is the playlist name, so add that to the dict
+                    # Depth 1 is the playlist, so add its ID to the dict
                     if depth == 1:
-                        filt_dict[widget.currentText()] = {"_and": {}, "_or": {}}
-                        # Store current playlist name being filled in
-                        pl = widget.currentText()
+                        filt_dict[widget.currentData()] = {"_and": {}, "_or": {}}
+                        # Store current playlist ID being filled in
+                        pl = widget.currentData()
                     # Depth 4 has the filter type, so add that
                     elif depth == 4:
                         filt_dict[pl][logic][widget.currentText()] = ""
@@ -243,8 +243,7 @@ class AdvFilterPlaylistsUI(QWidget):
         Create another selection from playlists for filtering
         """
         # Create list for selection of playlists
-        pl_choice = QComboBox()
-        pl_choice.addItems(self.user.playlists)
+        pl_choice = PlaylistComboBox(self.user.playlists)
         pl_choice.setContentsMargins(150, 150, 150, 150)
         # Add AND/OR logic selection
         add_logic = QPushButton("Add Logic")
@@ -326,6 +325,8 @@ class AdvFilterPlaylistsUI(QWidget):
                 "song_exact",
                 "song_and",
                 "song_or",
+                "song_fuzzy",
+                "artist_fuzzy",
             ]
         )
 
@@ -385,18 +386,15 @@ class SimpleFilterPlaylistUI(QWidget):
         self.artists.currentIndexChanged.connect(self.add_artists)
 
         # Playlists Combobox like in PlaylistSongsUI
-        self.playlists = QComboBox()
-        self.playlists.addItems(self.user.playlists)
+        self.playlists = PlaylistComboBox(self.user.playlists)
         self.playlists.setFixedWidth(self.ADD_PLAYLIST_WIDTH)
         # Get the artists of this playlist
         self.playlists.currentIndexChanged.connect(
-            lambda: self.get_unique_artists(
-                self.user.pl_ids[self.playlists.currentIndex()]
-            )
+            lambda: self.get_unique_artists(self.playlists.currentData())
         )
 
         # Initialize for self.artists
-        self.get_unique_artists(self.user.pl_ids[self.playlists.currentIndex()])
+        self.get_unique_artists(self.playlists.currentData())
         # Combobox choice for including or excluding
         self.logic = QComboBox()
         self.logic.addItems(["Include", "Exclude"])
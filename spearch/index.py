@@ -0,0 +1,317 @@
+"""
+Indexes over the normalized names of a playlist's songs, so filters can find
+the few songs worth checking instead of checking every one.
+"""
+
+from array import array
+from collections import defaultdict
+from threading import Lock, Thread
+
+from bitset import from_positions, full, iter_bits
+from fuzzy import BKTree
+from table import TrackTable
+
+
+class TrigramIndex:
+    N = 3
+
+    def __init__(self):
+        """
+        An inverted index from every 3 character substring (trigram) of some
+        texts to the keys of the texts it's in. Any text that has a term in it
+        must have every trigram of the term in it, so intersecting the
+        postings of the term's trigrams gives every key that might have the
+        term. Those still need checking, the trigrams may not be in order.
+        Keys are ints (positions) and candidates come back as a bitset (see
+        the bitset module) of them, so intersecting postings is a single AND each.
+        Each trigram's keys are kept in an array rather than a set of ints,
+        which takes a fraction of the memory, so keys are expected to be added
+        in increasing order like positions are.
+        """
+        self.postings = defaultdict(_positions)
+        # Postings turned into bitsets, made when first needed
+        self._bits = {}
+
+    @classmethod
+    def grams(cls, text):
+        """
+        The set of trigrams in a text
+        """
+        return {text[i : i + cls.N] for i in range(len(text) - cls.N + 1)}
+
+    def add(self, key, text):
+        """
+        Adds a text under a key (a key can have any number of texts)
+        """
+        for gram in self.grams(text):
+            _add_position(self.postings[gram], key)
+            self._bits.pop(gram, None)
+
+    def remove(self, key, text):
+        """
+        Removes a text that was added under a key
+        """
+        for gram in self.grams(text):
+            self._bits.pop(gram, None)
+            keys = self.postings.get(gram)
+            if keys is not None:
+                _remove_position(keys, key)
+                if not keys:
+                    del self.postings[gram]
+
+    def bits(self, gram):
+        """
+        Returns the postings of a trigram as a bitset
+        """
+        bits = self._bits.get(gram)
+        if bits is None:
+            bits = self._bits[gram] = from_positions(self.postings.get(gram, ()))
+        return bits
+
+    def candidates(self, term):
+        """
+        Returns the bitset of keys whose texts might have the term in them, or
+        None if the term is too short to narrow anything down
+
+        Parameters:
+        term - A normalized term
+        """
+        if len(term) < self.N:
+            return None
+
+        # Intersect from the rarest trigram so it can stop as soon as it's empty
+        grams = sorted(
+            self.grams(term), key=lambda gram: len(self.postings.get(gram, ()))
+        )
+        keys = self.bits(grams[0])
+        for gram in grams[1:]:
+            if not keys:
+                break
+            keys &= self.bits(gram)
+        return keys
+
+
+def _positions():
+    """
+    A new, empty array of positions
+    """
+    return array("L")
+
+
+def _add_position(positions, position):
+    """
+    Adds a position to the end of an array of positions unless it's already
+    the last one, as a song can have the same trigram or artist twice
+    """
+    if not positions or positions[-1] != position:
+        positions.append(position)
+
+
+def _remove_position(positions, position):
+    """
+    Removes a position from an array of positions if it's in it
+    """
+    try:
+        positions.remove(position)
+    except ValueError:
+        pass
+
+
+class TrackIndex:
+    def __init__(self, tracks=(), library=None):
+        """
+        A playlist's songs in playlist order, kept in a table.TrackTable,
+        along with trigram indexes of their song names and artist names. It
+        can be used anywhere the songs can be, and a compiled filter given
+        one only checks the songs the indexes say might match. Songs are
+        keyed by position, a removed song stays in the table but is skipped
+        so the other positions don't change.
+
+        Parameters:
+        tracks - (default ()) The songs to start with, a TrackTable or
+                 tracks.Track's
+        library - (default None) The table.TrackLibrary to keep the songs
+                  in. If None, the one of tracks if it's a TrackTable or else
+                  a new one
+        """
+        if library is None and isinstance(tracks, TrackTable):
+            library = tracks.library
+        self.tracks = TrackTable(library=library)
+        self.names = TrigramIndex()
+        self.artists = TrigramIndex()
+        # Maps normalized song name (or artist name) -> array of the
+        # positions of the songs with it
+        self.exact_names = defaultdict(_positions)
+        self.exact_artists = defaultdict(_positions)
+        # BK-trees of the different names for fuzzy matching, only made once
+        # a fuzzy filter needs them since they're slow to make. They're made
+        # on another thread while fuzzy filters check every song meanwhile
+        self._name_tree = None
+        self._artist_tree = None
+        self._building = None
+        self._lock = Lock()
+        self._removed = 0
+        self._removed_mask = 0
+        if isinstance(tracks, TrackTable) and tracks.library is self.tracks.library:
+            # Already in the library, so skip making Track's of them
+            for row in tracks.rows:
+                self._add_row(row)
+        else:
+            for track in tracks:
+                self.add(track)
+
+    def add(self, track):
+        """
+        Adds a Track to the end and indexes it, returning its position
+        """
+        return self._add_row(self.tracks.library.intern(track))
+
+    def _add_row(self, row):
+        """
+        Adds the song in a row of the library to the end and indexes it,
+        returning its position
+        """
+        library = self.tracks.library
+        name_key = library.name_keys[row]
+        # Held so the BK-trees being made on another thread don't miss a name
+        with self._lock:
+            position = len(self.tracks)
+            self.tracks.extend_rows([row])
+            self.names.add(position, name_key)
+            self._add_exact(self.exact_names, self._name_tree, name_key, position)
+            for artist in library.artist_keys(row):
+                self.artists.add(position, artist)
+                self._add_exact(self.exact_artists, self._artist_tree, artist, position)
+        return position
+
+    @staticmethod
+    def _add_exact(exact, tree, key, position):
+        """
+        Adds a position under a name, and the name to its BK-tree if it's new
+        """
+        if key not in exact and tree is not None:
+            tree.add(key)
+        _add_position(exact[key], position)
+
+    @staticmethod
+    def _remove_exact(exact, key, position):
+        """
+        Removes a position from under a name. The name stays in its BK-tree
+        (they can't remove), but finds nothing once it has no positions.
+        """
+        positions = exact[key]
+        _remove_position(positions, position)
+        if not positions:
+            del exact[key]
+
+    def remove(self, position):
+        """
+        Removes the song at a position from the index
+        """
+        if self._removed_mask >> position & 1:
+            return
+        track = self.tracks[position]
+        self.names.remove(position, track.name_key)
+        self._remove_exact(self.exact_names, track.name_key, position)
+        for artist in track.artist_keys:
+            self.artists.remove(position, artist)
+            self._remove_exact(self.exact_artists, artist, position)
+        self._removed += 1
+        self._removed_mask |= 1 << position
+
+    def live(self):
+        """
+        Returns the bitset of the positions that haven't been removed
+        """
+        return full(len(self.tracks)) & ~self._removed_mask
+
+    def name_candidates(self, term):
+        """
+        Bitset of the songs whose name might have the term, None if any
+        """
+        return self.names.candidates(term)
+
+    def exact_name_candidates(self, name):
+        """
+        Bitset of the songs whose name is exactly the (normalized) name
+        """
+        return from_positions(self.exact_names.get(name, ()))
+
+    def build_trees(self, wait=True):
+        """
+        Makes the BK-trees of the song names and artist names fuzzy filters
+        search, on another thread. Called by the first fuzzy filter, call it
+        ahead of time to have them ready sooner.
+
+        Parameters:
+        wait - (default True) If True, returns once the trees are made
+        """
+        with self._lock:
+            if self._building is None and self._name_tree is None:
+                self._building = Thread(target=self._build_trees, daemon=True)
+                self._building.start()
+            building = self._building
+        if wait and building is not None:
+            building.join()
+
+    def _build_trees(self):
+        """
+        Makes the BK-trees from the names there are now, then adds the names
+        added to the index while making them
+        """
+        with self._lock:
+            names, artists = list(self.exact_names), list(self.exact_artists)
+        name_tree, artist_tree = BKTree(names), BKTree(artists)
+        with self._lock:
+            for key in set(self.exact_names).difference(names):
+                name_tree.add(key)
+            for key in set(self.exact_artists).difference(artists):
+                artist_tree.add(key)
+            self._name_tree, self._artist_tree = name_tree, artist_tree
+            self._building = None
+
+    def fuzzy_name_candidates(self, term, max_distance):
+        """
+        Bitset of the songs whose name is within max_distance edits of term,
+        None (every song) until the BK-trees are made
+        """
+        tree = self._name_tree
+        if tree is None:
+            self.build_trees(wait=False)
+            return None
+        return self._fuzzy_candidates(self.exact_names, tree.search(term, max_distance))
+
+    def fuzzy_artist_candidates(self, term, max_distance):
+        """
+        Bitset of the songs with an artist whose name is within max_distance
+        edits of term, None (every song) until the BK-trees are made
+        """
+        tree = self._artist_tree
+        if tree is None:
+            self.build_trees(wait=False)
+            return None
+        return self._fuzzy_candidates(
+            self.exact_artists, tree.search(term, max_distance)
+        )
+
+    @staticmethod
+    def _fuzzy_candidates(exact, keys):
+        """
+        Bitset of the songs with any of the names
+        """
+        return from_positions(
+            position for key in keys for position in exact.get(key, ())
+        )
+
+    def artist_candidates(self, term):
+        """
+        Bitset of the songs with an artist that might have the term, None if
+        any
+        """
+        return self.artists.candidates(term)
+
+    def __iter__(self):
+        return (self.tracks[position] for position in iter_bits(self.live()))
+
+    def __len__(self):
+        return len(self.tracks) - self._removed
@@ -0,0 +1,79 @@
+from collections import deque
+
+
+class MultiMatcher:
+    def __init__(self, patterns):
+        """
+        Finds which of many patterns are in a text in a single pass over the
+        text (an Aho-Corasick automaton), instead of searching the text once
+        for each pattern. Built once for a list of patterns and then used on
+        any number of texts.
+
+        Parameters:
+        patterns - The strings to look for
+        """
+        self.patterns = list(patterns)
+        # Each state is a node of the trie of the patterns, with the edges out
+        # of it, the state to fall back to when no edge fits and the patterns
+        # that end there (including through its fallbacks)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for pattern_ind, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][char] = nxt
+                state = nxt
+            self._out[state] += (pattern_ind,)
+
+        # Breadth first so a state's fallback is always done before its own
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def _states(self, text):
+        """
+        Yields the state after each character of the text
+        """
+        goto, fail = self._goto, self._fail
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            yield state
+
+    def search(self, text):
+        """
+        Returns whether any of the patterns are in the text, stopping at the
+        first one found
+        """
+        out = self._out
+        # An empty pattern is in every text
+        if out[0]:
+            return True
+        return any(out[state] for state in self._states(text))
+
+    def find_all(self, text):
+        """
+        Returns the set of the patterns that are in the text
+        """
+        out = self._out
+        found = set(out[0])
+        for state in self._states(text):
+            found.update(out[state])
+        return {self.patterns[pattern_ind] for pattern_ind in found}
@@ -0,0 +1,151 @@
+from collections import OrderedDict, namedtuple
+from threading import RLock
+
+# What's known about a playlist without fetching its songs
+Playlist = namedtuple("Playlist", ["id", "name", "snapshot_id", "owner", "size"])
+
+
+class PlaylistRegistry:
+    # Events subscribers are told about
+    ADDED = "added"
+    UPDATED = "updated"
+    REMOVED = "removed"
+
+    def __init__(self, playlists=()):
+        """
+        The user's playlists in the order Spotify gives them, kept by ID in
+        an OrderedDict along with a dictionary of the IDs with each name, so
+        finding, adding, changing and removing a playlist each take a
+        dictionary lookup rather than a search through every playlist.
+        Whoever shows the playlists subscribes to be told about every change.
+
+        Parameters:
+        playlists - (default ()) The Playlist's to start with
+        """
+        self._lock = RLock()
+        self._listeners = []
+        # Maps playlist ID -> Playlist, in the user's order
+        self._playlists = OrderedDict()
+        # Maps playlist name -> dictionary of the IDs of playlists with that
+        # name, in the order added, as names don't have to be different
+        self._names = {}
+        for playlist in playlists:
+            self.add(playlist)
+
+    def subscribe(self, callback):
+        """
+        Calls callback(event, playlist) every time a playlist is added,
+        updated or removed, event being ADDED, UPDATED or REMOVED and playlist
+        the Playlist after the change (before it for REMOVED)
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Stops calling a callback that was subscribed
+        """
+        with self._lock:
+            self._listeners.remove(callback)
+
+    def _notify(self, event, playlist):
+        """
+        Tells the subscribers about a change, called with the lock held
+        """
+        for callback in self._listeners:
+            callback(event, playlist)
+
+    def add(self, playlist):
+        """
+        Adds a playlist to the end, replacing one with the same ID
+
+        Parameters:
+        playlist - The Playlist
+        """
+        with self._lock:
+            if playlist.id in self._playlists:
+                self.update(playlist.id, **playlist._asdict())
+                return
+            self._playlists[playlist.id] = playlist
+            self._names.setdefault(playlist.name, {})[playlist.id] = None
+            self._notify(self.ADDED, playlist)
+
+    def update(self, pl_id, **changes):
+        """
+        Changes some of what's known about a playlist and returns the new
+        Playlist
+
+        Parameters:
+        pl_id - The ID of the playlist
+        changes - The fields of Playlist to change and their new values
+        """
+        with self._lock:
+            old = self._playlists[pl_id]
+            playlist = self._playlists[pl_id] = old._replace(**changes)
+            if playlist.name != old.name:
+                self._forget_name(old)
+                self._names.setdefault(playlist.name, {})[pl_id] = None
+            self._notify(self.UPDATED, playlist)
+            return playlist
+
+    def remove(self, pl_id):
+        """
+        Removes a playlist and returns it
+        """
+        with self._lock:
+            playlist = self._playlists.pop(pl_id)
+            self._forget_name(playlist)
+            self._notify(self.REMOVED, playlist)
+            return playlist
+
+    def _forget_name(self, playlist):
+        """
+        Takes a playlist out of the name index
+        """
+        ids = self._names[playlist.name]
+        del ids[playlist.id]
+        if not ids:
+            del self._names[playlist.name]
+
+    def get(self, pl_id, default=None):
+        """
+        Returns the Playlist with an ID, or default if there isn't one
+        """
+        return self._playlists.get(pl_id, default)
+
+    def by_name(self, name):
+        """
+        Returns the list of the Playlist's with a name
+        """
+        with self._lock:
+            return [self._playlists[pl_id] for pl_id in self._names.get(name, ())]
+
+    def ids(self):
+        """
+        Returns the list of the playlist IDs in order
+        """
+        with self._lock:
+            return list(self._playlists)
+
+    def names(self):
+        """
+        Returns the list of the playlist names in order
+        """
+        with self._lock:
+            return [playlist.name for playlist in self._playlists.values()]
+
+    def __getitem__(self, pl_id):
+        return self._playlists[pl_id]
+
+    def __contains__(self, pl_id):
+        return pl_id in self._playlists
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._playlists.values()))
+
+    def __len__(self):
+        return len(self._playlists)
+
+    def __repr__(self):
+        return "PlaylistRegistry({} playlists)".format(len(self))
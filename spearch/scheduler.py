@@ -0,0 +1,152 @@
+from random import uniform
+from threading import Condition
+from time import monotonic, sleep
+
+import requests
+
+
+# Priorities a request can be scheduled with, interactive requests (the ones
+# a user is waiting on) always go before background ones
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class RequestScheduler:
+    # Responses worth trying again, the rest are handed back as is
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    # Methods that do the same thing however many times they're sent. The
+    # rest (e.g. POST adding songs) may already have been done by the server
+    # when a request fails, so they're only retried if it can't have been
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+    def __init__(self, rate=25, burst=50, max_retries=5, backoff=0.5, max_backoff=30):
+        """
+        Sends every request made through it, pacing them with a token bucket
+        shared by all threads. A 429 response pauses every request for as
+        long as its Retry-After header asks (or a backoff if it doesn't say),
+        other failures are retried after a jittered exponential backoff.
+        Requests that aren't safe to send twice, like POSTs, are only retried
+        when the server can't have got them: after a 429 or a connect timeout.
+        Background requests wait while any interactive request is waiting.
+
+        Parameters:
+        rate - (default 25) Requests per second allowed on average
+        burst - (default 50) Requests that can be sent at once after idling
+        max_retries - (default 5) Times a request is retried before the last
+                      response (or error) is handed back
+        backoff - (default 0.5) Seconds the backoff starts from, it doubles
+                  with every retry
+        max_backoff - (default 30) Most seconds a single backoff can be
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._cond = Condition()
+        self._tokens = burst
+        self._updated = monotonic()
+        self._paused_until = 0
+        self._waiting_interactive = 0
+
+    def request(self, session, method, url, priority=INTERACTIVE, **kwargs):
+        """
+        Sends a request once the scheduler allows it and returns the response,
+        retrying it if it's rate limited or fails
+
+        Parameters:
+        session - What sends the request, a requests.Session or the requests
+                  module itself
+        method - The HTTP method, e.g. 'GET'
+        url - The URL to request
+        priority - (default INTERACTIVE) INTERACTIVE or BACKGROUND
+        kwargs - Passed along to session.request
+        """
+        if method.upper() in self.IDEMPOTENT_METHODS:
+            retry_errors = (requests.ConnectionError, requests.Timeout)
+            retry_statuses = self.RETRY_STATUSES
+        else:
+            retry_errors = requests.ConnectTimeout
+            retry_statuses = {429}
+
+        for attempt in range(self.max_retries + 1):
+            self._acquire(priority)
+            try:
+                response = session.request(method, url, **kwargs)
+            except retry_errors:
+                if attempt == self.max_retries:
+                    raise
+                sleep(self._backoff(attempt))
+                continue
+
+            if (
+                response.status_code not in retry_statuses
+                or attempt == self.max_retries
+            ):
+                return response
+
+            if response.status_code == 429:
+                # Rate limits are for the whole app, so hold everyone back
+                self.pause(self._retry_after(response, attempt))
+            else:
+                sleep(self._backoff(attempt))
+
+    def pause(self, seconds):
+        """
+        Holds back every request for the given number of seconds
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, monotonic() + seconds)
+            self._cond.notify_all()
+
+    def _acquire(self, priority):
+        """
+        Blocks until a token is free for a request of the given priority
+        """
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._waiting_interactive += 1
+            try:
+                while True:
+                    now = monotonic()
+                    self._refill(now)
+
+                    wait = self._paused_until - now
+                    if wait <= 0:
+                        if priority == BACKGROUND and self._waiting_interactive:
+                            # Woken up once the interactive requests are through
+                            wait = None
+                        elif self._tokens >= 1:
+                            self._tokens -= 1
+                            return
+                        else:
+                            wait = (1 - self._tokens) / self.rate
+                    self._cond.wait(wait)
+            finally:
+                if priority == INTERACTIVE:
+                    self._waiting_interactive -= 1
+                    self._cond.notify_all()
+
+    def _refill(self, now):
+        """
+        Adds the tokens earned since the last refill
+        """
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _backoff(self, attempt):
+        """
+        Seconds to wait before the next retry, with full jitter
+        """
+        return uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retry_after(self, response, attempt):
+        """
+        Seconds a rate limited response asks to wait, or a backoff if it
+        doesn't say
+        """
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return self._backoff(attempt)
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from itertools import count
+
+
+class SongQueue:
+    def __init__(self, uris=(), duplicate=False):
+        """
+        The songs of a queue in order, by URI. Kept in an OrderedDict along
+        with a dictionary of where each song is, so checking whether a song is
+        queued, adding, removing and moving a song only take a set lookup
+        rather than a search through the whole queue. A song can be in the
+        queue more than once if asked for.
+
+        Parameters:
+        uris - (default ()) The song URIs to start with
+        duplicate - (default False) If True, keeps songs given more than once
+        """
+        # Maps entry number -> song URI, in queue order
+        self._entries = OrderedDict()
+        # Maps song URI -> dictionary of its entry numbers, in queue order as
+        # the copies of a song always move together
+        self._places = {}
+        self._numbers = count()
+        self.extend(uris, duplicate)
+
+    def append(self, uri, duplicate=False):
+        """
+        Adds a song to the end and returns whether it was added
+
+        Parameters:
+        uri - The song URI
+        duplicate - (default False) If True, adds the song even if it's
+                    already queued, else not
+        """
+        places = self._places.get(uri)
+        if places and not duplicate:
+            return False
+        if places is None:
+            places = self._places[uri] = {}
+
+        number = next(self._numbers)
+        self._entries[number] = uri
+        places[number] = None
+        return True
+
+    def extend(self, uris, duplicate=False):
+        """
+        Adds songs to the end in order and returns how many were added
+
+        Parameters:
+        uris - The song URIs
+        duplicate - (default False) If True, adds songs already queued or
+                    given more than once, else only the first of each
+        """
+        return sum(self.append(uri, duplicate) for uri in uris)
+
+    def remove(self, uri):
+        """
+        Removes every copy of a song and returns how many there were
+        """
+        places = self._places.pop(uri, {})
+        for number in places:
+            del self._entries[number]
+        return len(places)
+
+    def reorder(self, uris, last=False):
+        """
+        Moves songs to the front, in the order given, or to the end. Every
+        copy of a song moves together and songs not queued are skipped.
+
+        Parameters:
+        uris - The song URIs to move
+        last - (default False) If True, moves them to the end instead
+        """
+        # Moving to the front one at a time reverses them, so go backwards
+        uris = list(uris)
+        if not last:
+            uris.reverse()
+        for uri in uris:
+            numbers = list(self._places.get(uri, ()))
+            if not last:
+                numbers.reverse()
+            for number in numbers:
+                self._entries.move_to_end(number, last)
+
+    def dedup(self):
+        """
+        Removes all but the first copy of every song and returns how many
+        were removed
+        """
+        removed = 0
+        for places in self._places.values():
+            if len(places) < 2:
+                continue
+            for number in list(places)[1:]:
+                del self._entries[number]
+                del places[number]
+                removed += 1
+        return removed
+
+    def clear(self):
+        """
+        Removes every song
+        """
+        self._entries.clear()
+        self._places.clear()
+
+    def uris(self):
+        """
+        Returns the list of the song URIs in order, the 'uris' play takes
+        """
+        return list(self._entries.values())
+
+    def __contains__(self, uri):
+        return uri in self._places
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "SongQueue({} songs)".format(len(self))
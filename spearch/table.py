@@ -0,0 +1,257 @@
+"""
+Songs stored by column instead of as a tuple per song. Every different song is
+kept once in a TrackLibrary, by its ID, and every different artist name once
+in an ArtistPool. A playlist's TrackTable is then just the library rows of its
+songs in playlist order, duplicates included, so memory grows with the
+different songs rather than with how many playlists they're in.
+"""
+
+from array import array
+from threading import Lock
+
+from bitset import iter_bits
+from tracks import Track, normalize
+
+
+class ArtistPool:
+    def __init__(self):
+        """
+        Every different artist name seen along with its normalized name, each
+        kept once and referred to by its position. Names can be added from
+        several threads at once.
+        """
+        self.names = []
+        self.keys = []
+        self._ids = {}
+        self._lock = Lock()
+
+    def intern(self, name, key=None):
+        """
+        Returns the position of an artist name, adding it if it's new
+
+        Parameters:
+        name - The artist name
+        key - (default None) The normalized artist name, worked out if None
+        """
+        artist_id = self._ids.get(name)
+        if artist_id is not None:
+            return artist_id
+
+        if key is None:
+            key = normalize(name)
+        with self._lock:
+            # Another thread may have added it while waiting
+            artist_id = self._ids.get(name)
+            if artist_id is None:
+                self.names.append(name)
+                self.keys.append(key)
+                artist_id = self._ids[name] = len(self.names) - 1
+            return artist_id
+
+    def __len__(self):
+        return len(self.names)
+
+
+class TrackLibrary:
+    def __init__(self, pool=None):
+        """
+        Every different song seen in any playlist, kept once by song ID (or
+        by name and artists for local files, which have no ID). Kept as
+        columns: the song IDs, song names, normalized song names and, for
+        each song, the offset of its artists in a single array of positions
+        in an ArtistPool. Each song is referred to by its row.
+
+        Parameters:
+        pool - (default None) The ArtistPool to keep the artist names in, a
+               new one is made if None
+        """
+        self.pool = ArtistPool() if pool is None else pool
+        self.ids = []
+        self.names = []
+        self.name_keys = []
+        # The artists of row i are artist_refs[artist_offsets[i]:...[i + 1]]
+        self.artist_offsets = array("L", [0])
+        self.artist_refs = array("L")
+        self._rows = {}
+        self._lock = Lock()
+
+    def intern(self, track):
+        """
+        Returns the row of a song, adding it if it's new
+
+        Parameters:
+        track - A Track or a tuple of (song, tuple of the artists, song ID)
+        """
+        key = track[2] if track[2] is not None else (track[0], tuple(track[1]))
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+
+        if isinstance(track, Track):
+            name_key, artist_keys = track.name_key, track.artist_keys
+        else:
+            name_key, artist_keys = normalize(track[0]), [None] * len(track[1])
+        refs = [
+            self.pool.intern(artist, artist_key)
+            for artist, artist_key in zip(track[1], artist_keys)
+        ]
+
+        with self._lock:
+            # Another thread may have added it while waiting
+            row = self._rows.get(key)
+            if row is None:
+                self.ids.append(track[2])
+                self.names.append(track[0])
+                # Most names are their own normalized name, so keep just the one
+                self.name_keys.append(track[0] if name_key == track[0] else name_key)
+                self.artist_refs.extend(refs)
+                self.artist_offsets.append(len(self.artist_refs))
+                row = self._rows[key] = len(self.ids) - 1
+            return row
+
+    def row(self, song_id):
+        """
+        Returns the row of the song with an ID, None if it's not been seen
+        """
+        return self._rows.get(song_id)
+
+    def artists(self, row):
+        """
+        Returns the tuple of the artist names of a row
+        """
+        return self._artists(row, self.pool.names)
+
+    def artist_keys(self, row):
+        """
+        Returns the tuple of the normalized artist names of a row
+        """
+        return self._artists(row, self.pool.keys)
+
+    def _artists(self, row, column):
+        """
+        The tuple of a row's artists from a column of the ArtistPool
+        """
+        offsets = self.artist_offsets
+        return tuple(
+            column[ref] for ref in self.artist_refs[offsets[row] : offsets[row + 1]]
+        )
+
+    def track(self, row):
+        """
+        Returns the song in a row as a Track
+        """
+        return Track(
+            self.names[row],
+            self.artists(row),
+            self.ids[row],
+            self.name_keys[row],
+            self.artist_keys(row),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class TrackTable:
+    def __init__(self, tracks=(), library=None):
+        """
+        A list of songs kept as the rows of the songs in a TrackLibrary.
+        Indexing it gives tracks.Track's like the rest of the code expects,
+        made when asked for. Slicing it or selecting from it with a bitset
+        gives another table of the same rows rather than copies of the songs.
+
+        Parameters:
+        tracks - (default ()) The songs to start with, Track's or tuples of
+                 (song, tuple of the artists, song ID)
+        library - (default None) The TrackLibrary to keep the songs in, a new
+                  one is made if None. Share one between every table so a
+                  song in many playlists is only kept once
+        """
+        self.library = TrackLibrary() if library is None else library
+        self.rows = array("L")
+        self.extend(tracks)
+
+    def append(self, track):
+        """
+        Adds a song to the end
+
+        Parameters:
+        track - A Track or a tuple of (song, tuple of the artists, song ID)
+        """
+        self.rows.append(self.library.intern(track))
+
+    def extend(self, tracks):
+        """
+        Adds songs to the end
+        """
+        for track in tracks:
+            self.append(track)
+
+    def extend_rows(self, rows):
+        """
+        Adds songs already in the library to the end by their rows
+        """
+        self.rows.extend(rows)
+
+    def track(self, position):
+        """
+        Returns the song at a position as a Track
+        """
+        return self.library.track(self.rows[position])
+
+    def values(self, field, positions):
+        """
+        Yields (position, value) of a single field of the songs at the given
+        positions without making the whole Track, for filtering
+
+        Parameters:
+        field - 'name_key' or 'artist_keys'
+        positions - The positions of the songs
+        """
+        rows = self.rows
+        if field == "name_key":
+            name_keys = self.library.name_keys
+            for position in positions:
+                yield position, name_keys[rows[position]]
+        else:
+            artist_keys = self.library.artist_keys
+            for position in positions:
+                yield position, artist_keys(rows[position])
+
+    def song_ids(self):
+        """
+        Returns the list of the song IDs in order
+        """
+        ids = self.library.ids
+        return [ids[row] for row in self.rows]
+
+    def select(self, mask):
+        """
+        Returns a table of the songs whose positions are in a bitset (see the
+        bitset module)
+        """
+        rows = self.rows
+        return self._view(array("L", (rows[position] for position in iter_bits(mask))))
+
+    def _view(self, rows):
+        """
+        Returns a table of the given rows of the same library
+        """
+        view = TrackTable.__new__(TrackTable)
+        view.library = self.library
+        view.rows = rows
+        return view
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._view(self.rows[key])
+        return self.track(key)
+
+    def __iter__(self):
+        return (self.library.track(row) for row in self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return "TrackTable({} songs)".format(len(self))
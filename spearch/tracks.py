@@ -0,0 +1,50 @@
+from collections import namedtuple
+from unicodedata import normalize as unicode_normalize
+
+
+def normalize(text):
+    """
+    The form names are compared in when filtering: Unicode normalized (NFKC)
+    so that the same characters written differently are equal, then
+    casefolded so that the comparison is case-insensitive
+    """
+    return unicode_normalize("NFKC", text).casefold()
+
+
+class Track(namedtuple("Track", ["name", "artists", "id", "name_key", "artist_keys"])):
+    """
+    A song as (song, tuple of the artists, song ID) like it's always been, so
+    it can still be indexed as song[0], song[1] and song[2]. It also carries
+    the normalized song name and artist names, worked out once when the song
+    is fetched or loaded so filtering never has to do it.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def make(cls, name, artists, song_id):
+        """
+        Makes a Track, normalizing the names
+
+        Parameters:
+        name - The song name
+        artists - The artist names
+        song_id - The song ID
+        """
+        artists = tuple(artists)
+        return cls(
+            name,
+            artists,
+            song_id,
+            normalize(name),
+            tuple(normalize(artist) for artist in artists),
+        )
+
+
+def as_track(song):
+    """
+    Returns the song as a Track, making one if it's a plain tuple
+    """
+    if isinstance(song, Track):
+        return song
+    return Track.make(song[0], song[1], song[2])
@@ -1,38 +1,21 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
-from itertools import compress
 from math import ceil
+from weakref import WeakKeyDictionary
 from json import dumps
 
 import requests
+from requests.adapters import HTTPAdapter
 
-
-"""
-Binary operators as functions for the song filtering
-"""
-
-
-def _equiv(x, y):
-    return x == y
-
-
-def _in(x, y):
-    return x in y
-
-
-def _and_iter(l1, l2):
-    if len(l1) != len(l2):
-        raise Exception("Lengths of lists should equal for comparing.")
-    return [l1[x] and l2[x] for x in range(len(l1))]
-
-
-def _or_iter(l1, l2):
-    if len(l1) != len(l2):
-        raise Exception("Lengths of lists should equal for comparing.")
-    return [l1[x] or l2[x] for x in range(len(l1))]
-
-
-def _not_iter(l1):
-    return [not x for x in l1]
+from cache import TTLCache
+from filters import FilterSession, canonical_spec, compile_filter
+from index import TrackIndex
+from playlists import Playlist, PlaylistRegistry
+from scheduler import RequestScheduler, INTERACTIVE
+from song_queue import SongQueue
+from table import TrackLibrary, TrackTable
+from tracks import Track
 
 
 class User:
@@ -40,51 +23,231 @@ class User:
     ME_URL = URL + "me/"
     TRACK = "spotify:track:"
 
-    def __init__(self, token, token_birth):
+    JSON_HEADERS = {"Content-Type": "application/json"}
+    # Only ask the API for the parts of the responses that are actually used
+    PLAYLIST_FIELDS = "total,items(name,id,snapshot_id,owner(id),tracks(total))"
+    TRACK_FIELDS = "items(track(name,id,artists(name)))"
+
+    def __init__(
+        self,
+        token,
+        token_birth,
+        pool_size=10,
+        max_workers=8,
+        track_cache=None,
+        cache_size=32,
+        cache_ttl=600,
+        scheduler=None,
+        token_provider=None,
+        index_songs=False,
+        filter_cache_size=16,
+    ):
+        """
+        The Spotify user the access token belongs to. Every API call goes
+        through a single keep-alive requests.Session, so connections to the
+        API are reused instead of being opened for every request.
+
+        Parameters:
+        token - The access token of the user
+        token_birth - The datetime the access token was made
+        pool_size - (default 10) The number of connections kept alive in the
+                    pool, which is the most requests that can be in flight
+                    at once without waiting for a free connection
+        max_workers - (default 8) The most pages that are requested at once
+                      when a listing spans several pages. Keep it at or below
+                      pool_size, 1 requests the pages one after another
+        track_cache - (default None) A cache.TrackCache to keep the songs of
+                      each playlist on disk between runs, a playlist is then
+                      only downloaded again once its snapshot ID changes
+        cache_size - (default 32) The most playlists whose songs are kept in
+                     memory, the least recently used one is dropped first
+        cache_ttl - (default 600) Seconds the songs of a playlist are kept in
+                    memory for, None keeps them until they are dropped
+        scheduler - (default None) The scheduler.RequestScheduler every
+                    request is sent through, share the Client's so the two
+                    are rate limited together. A new one is made if None
+        token_provider - (default None) The auth.TokenProvider of the Client.
+                         If given, every new token it gets is used right away
+                         and a request refused with a 401 refreshes the token
+                         and is tried once more
+        index_songs - (default False) If True, get_filtered_songs,
+                      filter_playlists and filter_session filter through an
+                      index.TrackIndex of the playlist so substring filters
+                      only check the songs that might match. The index is
+                      made the first time a playlist is filtered, see
+                      get_playlist_index
+        filter_cache_size - (default 16) The most filter results kept for
+                            each playlist by get_filtered_songs
+        """
         self.token = token
         self.token_birth = token_birth
-        self.headers = {"Authorization": "Bearer " + self.token}
-        self.headers_json = {
-            "Authorization": "Bearer " + self.token,
-            "Content-Type": "application/json",
-        }
-        self.user = requests.get(self.ME_URL, headers=self.headers).json()["id"]
-        self.playlists, self.pl_ids, self.pl_lens = self._get_playlists()
-        self.queue = []
+        self.max_workers = max_workers
+        self.pool_size = pool_size
+        self.track_cache = track_cache
+        self.song_cache = TTLCache(cache_size, cache_ttl)
+        self.index_songs = index_songs
+        # Maps playlist ID -> TTLCache of its filter results
+        self.filter_cache = TTLCache(cache_size, cache_ttl)
+        self.filter_cache_size = filter_cache_size
+        # Indexes of the cached songs, dropped along with the songs
+        self._indexes = WeakKeyDictionary()
+        # Every song and artist name of every playlist is kept once in here
+        self.library = TrackLibrary()
+        self.scheduler = scheduler or RequestScheduler()
+        self.session = self._make_session(pool_size)
+        self.token_provider = token_provider
+        if token_provider is not None:
+            token_provider.subscribe(self._set_token)
+            self._set_token(token_provider.access_token, token_provider.token_birth)
+        self.user = self._request("GET", self.ME_URL).json()["id"]
+        self.playlists = PlaylistRegistry(self._get_playlists())
+        self.queue = SongQueue()
+
+    def _make_session(self, pool_size):
+        """
+        Creates the session shared by every call. The default headers live on
+        the session and the adapter's connection pool is thread-safe, so the
+        session can be shared between threads.
+        """
+        session = requests.Session()
+        session.headers.update({"Authorization": "Bearer " + self.token})
+
+        # Same sized pool for https and http (http is used by stub servers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _set_token(self, token, token_birth):
+        """
+        Switches every following request over to a new access token
+        """
+        self.token_birth = token_birth
+        self.token = token
+        # A single assignment, so a request is sent with either the old or
+        # the new header and never anything in between
+        self.session.headers["Authorization"] = "Bearer " + token
+
+    def _request(self, method, url, priority=INTERACTIVE, **kwargs):
+        """
+        Sends a request through the scheduler on the shared session. Raises
+        requests.HTTPError if the request still failed after any retries.
+        A 401 is retried once with a new token if there's a token provider.
+
+        Parameters:
+        method - The HTTP method, e.g. 'GET'
+        url - The URL to request
+        priority - (default INTERACTIVE) The scheduler priority
+        kwargs - Passed along to requests.Session.request
+        """
+        token = self.token
+        response = self.scheduler.request(
+            self.session, method, url, priority=priority, **kwargs
+        )
+        # The token expired early or was revoked, so get a new one and retry
+        if response.status_code == 401 and self.token_provider is not None:
+            self.token_provider.refresh(stale_token=token)
+            response = self.scheduler.request(
+                self.session, method, url, priority=priority, **kwargs
+            )
+        response.raise_for_status()
+        return response
+
+    def _get_pages(self, url, params_list, workers=None, priority=INTERACTIVE):
+        """
+        GETs the same url once for each dictionary of parameters, with at most
+        workers requests in flight at a time. The parsed JSON responses are
+        returned in the same order as params_list.
+
+        Parameters:
+        url - The URL to GET
+        params_list - A list of parameter dictionaries, one for each request
+        workers - (default None) Most requests at once, uses self.max_workers
+                  if None
+        priority - (default INTERACTIVE) The scheduler priority of the requests
+        """
+        return list(self._iter_pages(url, params_list, workers, priority))
+
+    def _iter_pages(self, url, params_list, workers=None, priority=INTERACTIVE):
+        """
+        Like _get_pages but yields each page as soon as it and every page
+        before it have arrived. Only a couple of pages per worker are fetched
+        ahead of the one being waited on, so memory stays bounded however
+        slowly the pages are consumed.
+        """
+        workers = min(workers or self.max_workers, len(params_list))
+
+        def get_page(params):
+            return self._request("GET", url, priority, params=params).json()
+
+        # Not worth starting up threads for a single page
+        if workers <= 1:
+            for params in params_list:
+                yield get_page(params)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = deque()
+            try:
+                for params in params_list:
+                    futures.append(executor.submit(get_page, params))
+                    if len(futures) >= 2 * workers:
+                        yield futures.popleft().result()
+                while futures:
+                    yield futures.popleft().result()
+            finally:
+                # Don't fetch pages nobody will see if the caller stopped early
+                for future in futures:
+                    future.cancel()
 
     def _get_playlists(self):
         """
         Get the playlists of the current user (as determined by the token)
         """
-        # Only allowed a maximum of 50 playlists at a time
-        pl_response = requests.get(
-            self.ME_URL + "playlists", headers=self.headers, params={"limit": 50}
-        )
+        url = self.ME_URL + "playlists"
+        # Only allowed a maximum of 50 playlists at a time, the first page
+        # tells us how many there are in total
+        first_page = self._request(
+            "GET", url, params={"limit": 50, "fields": self.PLAYLIST_FIELDS}
+        ).json()
+        num_pl = first_page["total"]
+
+        # Get rest of playlists all at once just in case num_pl > 50
+        params_list = [
+            {"limit": 50, "offset": offset * 50, "fields": self.PLAYLIST_FIELDS}
+            for offset in range(1, ceil(num_pl / 50))
+        ]
+        pages = [first_page] + self._get_pages(url, params_list)
 
-        # Get first <=50 playlists
-        playlists, pl_ids, pl_lens = [], [], []
-        for playlist in pl_response.json()["items"]:
-            playlists.append(playlist["name"])
-            pl_ids.append(playlist["id"])
-            pl_lens.append(playlist["tracks"]["total"])
-
-        # Get rest of playlists just in case num_pl > 50
-        num_pl = pl_response.json()["total"]
-
-        for offset in range(1, ceil(num_pl / 50)):
-            params = {"offset": offset * 50}
-            pl_response = requests.get(
-                self.ME_URL + "playlists",
-                headers=self.headers,
-                params={"limit": 50, "offset": offset * 50},
-            )
+        return self._parse_playlists(pages)
 
-            for playlist in pl_response.json()["items"]:
-                playlists.append(playlist["name"])
-                pl_ids.append(playlist["id"])
-                pl_lens.append(playlist["tracks"]["total"])
+    @staticmethod
+    def _parse_playlists(pages):
+        """
+        Builds the list of playlists.Playlist's from the pages of playlists
+        """
+        return [
+            Playlist(
+                playlist["id"],
+                playlist["name"],
+                playlist["snapshot_id"],
+                playlist["owner"]["id"],
+                playlist["tracks"]["total"],
+            )
+            for page in pages
+            for playlist in page["items"]
+        ]
 
-        return playlists, pl_ids, pl_lens
+    def _get_playlist(self, pl_id):
+        """
+        Returns the playlists.Playlist with an ID, making sure it exists
+        """
+        playlist = self.playlists.get(pl_id)
+        if playlist is None:
+            raise Exception(
+                "Playlist ID {} not found for user {}".format(pl_id, self.user)
+            )
+        return playlist
 
     def change_device(self, device_id):
         """
@@ -93,19 +256,15 @@ class User:
         Parameters:
         device_id - The ID of the device to switch to
         """
-        requests.put(
-            self.ME_URL + "player",
-            headers=self.headers,
-            data=dumps({"device_ids": [device_id]}),
+        self._request(
+            "PUT", self.ME_URL + "player", data=dumps({"device_ids": [device_id]})
         )
 
     def get_available_devices(self):
         """
         Get the available devices of the current user
         """
-        return requests.get(
-            self.ME_URL + "player/devices", headers=self.headers
-        ).json()["devices"]
+        return self._request("GET", self.ME_URL + "player/devices").json()["devices"]
 
     def play(self, data={}):
         """
@@ -117,96 +276,158 @@ class User:
         Parameters:
         data - (default {}) Song URIs to be passed to create a queue
         """
-        requests.put(
-            self.ME_URL + "player/play", headers=self.headers, data=dumps(data)
-        )
+        self._request("PUT", self.ME_URL + "player/play", data=dumps(data))
 
     def pause(self):
         """
         Pauses the music
         """
-        requests.put(self.ME_URL + "player/pause", headers=self.headers)
+        self._request("PUT", self.ME_URL + "player/pause")
 
-    def get_playlist_songs(self, pl_id):
+    def get_playlist_songs(self, pl_id, workers=None, priority=INTERACTIVE):
         """
-        Returns a list of [song, list of the artists, song ID] for each song in
-        a playlist for the given user.
+        Returns a table.TrackTable of the songs in a playlist, in playlist
+        order. Each song in it is a (song, tuple of the artists, song ID).
+        Recently fetched playlists come from memory and, if there is a track
+        cache and it has the playlist's current snapshot, the rest come from
+        there instead.
 
         Parameters:
         pl_id - The playlist id of the user to get the song data for
+        workers - (default None) The most pages of songs requested at once,
+                  uses self.max_workers if None
+        priority - (default INTERACTIVE) The scheduler priority of the
+                   requests, use BACKGROUND for prefetching and batch jobs
+        """
+        songs = self.song_cache.get(pl_id)
+        if songs is None:
+            songs = TrackTable(library=self.library)
+            # Loading fills the table, the pages themselves aren't needed
+            deque(self._load_songs(pl_id, workers, priority, songs), maxlen=0)
+        return songs
+
+    def iter_playlist_songs(
+        self, pl_id, workers=None, priority=INTERACTIVE, cache=True
+    ):
         """
-        # Make sure the playlist name exists
-        if pl_id not in self.pl_ids:
-            raise Exception(
-                "Playlist ID {} not found for user {}".format(pl_id, self.user)
-            )
+        Yields (song, tuple of the artists, song ID) for each song in a
+        playlist in playlist order. Songs are yielded page by page as the
+        pages arrive, so the first ones can be used before the whole playlist
+        is downloaded. Cached playlists are yielded from the caches like in
+        get_playlist_songs.
+
+        Parameters:
+        pl_id - The playlist id of the user to get the song data for
+        workers - (default None) The most pages of songs requested at once,
+                  uses self.max_workers if None
+        priority - (default INTERACTIVE) The scheduler priority of the
+                   requests, use BACKGROUND for prefetching and batch jobs
+        cache - (default True) If True, the songs are kept to fill the caches
+                once the last one is yielded. If False, nothing is kept so
+                memory stays bounded for playlists too big to hold at once
+        """
+        songs = self.song_cache.get(pl_id)
+        if songs is not None:
+            yield from songs
+            return
+
+        songs = TrackTable(library=self.library) if cache else None
+        for page_songs in self._load_songs(pl_id, workers, priority, songs):
+            yield from page_songs
+
+    def _load_songs(self, pl_id, workers, priority, songs=None):
+        """
+        Yields the list of songs in each page of a playlist, from the track
+        cache if it has the playlist's current snapshot or else from the API.
+        If songs is a TrackTable, every song is also added to it and it's put
+        in the caches after the last page.
+        """
+        playlist = self._get_playlist(pl_id)
+        snapshot_id = playlist.snapshot_id
+        # Don't download the playlist if it hasn't changed since it was cached
+        if self.track_cache is not None:
+            page_songs = self.track_cache.get(pl_id, snapshot_id)
+            if page_songs is not None:
+                if songs is not None:
+                    songs.extend(page_songs)
+                    self._cache_songs(pl_id, songs)
+                yield page_songs
+                return
 
         # Get playlist number of tracks for given playlist name
-        pl_len = self.pl_lens[self.pl_ids.index(pl_id)]
+        pl_len = playlist.size
 
         # Form URL to get song data
         url = self.URL + "users/{}/playlists/{}/tracks".format(self.user, pl_id)
 
-        songs = set()
-        # API only allows 100 songs at a time for some reason, so keep
-        # requesting 100 until we got them all
-        for offset in range(ceil(pl_len / 100)):
-            params = {"offset": offset * 100}
-            song_response = requests.get(url, headers=self.headers, params=params)
-            song_data = song_response.json()["items"]
-
-            for song in song_data:
-                songs.add(
-                    (
-                        song["track"]["name"],
-                        tuple([data["name"] for data in song["track"]["artists"]]),
-                        song["track"]["id"],
-                    )
-                )
+        # API only allows 100 songs at a time for some reason, but we know how
+        # many there are so request every page of 100 at once
+        params_list = [
+            {"offset": offset * 100, "fields": self.TRACK_FIELDS}
+            for offset in range(ceil(pl_len / 100))
+        ]
+        for page in self._iter_pages(url, params_list, workers, priority):
+            page_songs = self._parse_songs([page])
+            if songs is not None:
+                songs.extend(page_songs)
+            yield page_songs
 
-        return songs
+        if songs is not None:
+            self._cache_songs(pl_id, songs)
+            if self.track_cache is not None:
+                self.track_cache.put(pl_id, snapshot_id, songs)
 
-    @staticmethod
-    def _make_mask_artists(songs, logic, filt):
+    def get_playlist_index(self, pl_id, workers=None, priority=INTERACTIVE):
         """
-        A template used for filtering for artists_or and artists_and
+        Returns an index.TrackIndex of the songs in a playlist, which can be
+        passed to filter_playlist in place of the songs to only check the ones
+        its trigram indexes say might match. The index is kept for as long as
+        the playlist's songs are kept in memory, so it's only built once per
+        fetch of the playlist.
+
+        Parameters:
+        pl_id - The playlist id of the user to get the song data for
+        workers - (default None) The most pages of songs requested at once,
+                  uses self.max_workers if None
+        priority - (default INTERACTIVE) The scheduler priority of the
+                   requests, use BACKGROUND for prefetching and batch jobs
         """
-        mask = []
-        for song in songs:
-            # Map to lowercase, check if names given in artist list for songs
-            mask.append(
-                logic([y.lower() in map(lambda x: x.lower(), song[1]) for y in filt])
-            )
-        return mask
+        songs = self.get_playlist_songs(pl_id, workers, priority)
+        index = self._indexes.get(songs)
+        if index is None:
+            index = self._indexes[songs] = TrackIndex(songs)
+        return index
 
-    @staticmethod
-    def _make_mask_artist(songs, logic, filt):
+    def _cache_songs(self, pl_id, songs):
         """
-        A template used for filtering for artist_or and artist_and
+        Keeps the TrackTable of a playlist in memory
         """
-        mask = []
-        for song in songs:
-            # In lowercase, double loop to check against each artist for songs
-            mask.append(
-                any([logic([y.lower() in x.lower() for y in filt]) for x in song[1]])
-            )
-        return mask
+        self.song_cache.set(pl_id, songs)
 
     @staticmethod
-    def _make_mask_song(songs, logic, compare, filt):
+    def _parse_songs(pages):
         """
-        A tempalte used for filtering for song_exact, song_or and song_and
+        Builds the list of (song, tuple of the artists, song ID) from the pages
+        of a playlist's tracks, in playlist order. These are tracks.Track's so
+        the names are normalized for filtering right away.
         """
-        mask = []
-        for song in songs:
-            # In lowercase, look for == (exact) or 'in' the song name for songs
-            mask.append(logic([compare(x.lower(), song[0].lower()) for x in filt]))
-        return mask
+        songs = []
+        for page in pages:
+            for song in page["items"]:
+                songs.append(
+                    Track.make(
+                        song["track"]["name"],
+                        [data["name"] for data in song["track"]["artists"]],
+                        song["track"]["id"],
+                    )
+                )
+
+        return songs
 
     def filter_playlist(self, songs, _and=None, _or=None, _not=False, **kwargs):
         """
-        Given a list of songs in the format given by get_playlist_songs, it
-        will be filtered be filtered through arbitarily nested ANDs and ORs via
+        Given songs in the format given by get_playlist_songs, they will be
+        filtered be filtered through arbitarily nested ANDs and ORs via
         dictionaries with a NOT option. It is case-insensitive. For example:
 
                     _or=dict(
@@ -244,76 +465,121 @@ class User:
                        in it
             song_or - The song name must have at least one element of the list
                       found in it
+            song_fuzzy - The song name must be within a few edits (typos) of
+                         one of the elements in the list
+            artist_fuzzy - At least one artist of the song must be within a
+                           few edits of one of the elements in the list
+
+        How many edits the fuzzy keywords allow is set by a _max_distance in
+        the dictionary (default 2), which also applies to the dictionaries
+        nested in it.
+
+        The songs that pass are returned in the order given, as a TrackTable
+        if songs is a TrackTable or an index.TrackIndex and as a list
+        otherwise.
 
         Paramters:
-        songs - The list of songs to filter
+        songs - The songs to filter, a TrackTable, an index.TrackIndex or any
+                iterable of songs
         _and - (default None) Filter dictionary, it will AND all of it's values
         _or - (default None) Filter dictionary, it will OR all of it's values
-        _not - (default False) Will NOT the resulting mask. If to be applied
+        _not - (default False) Will NOT the result. If to be applied
                to a single kwarg, wrap in an _or dict
         kwargs - The top level filtering keywords (these will be OR'd with
                  each other and the _and and _or dict if they exist)
+
+        The spec is compiled with filters.compile_filter each call. To use the
+        same filter on many playlists, compile it once and call its filter
+        method on each instead.
         """
-        mask = self._build_mask(songs, _and=_and, _or=_or, **kwargs)
-        return set(compress(songs, mask))
+        spec = dict(kwargs, _and=_and, _or=_or, _not=_not)
+        return compile_filter(spec).filter(songs)
 
-    def _build_mask(
-        self, songs, mask=None, _and=None, _or=None, _not=False, or_logic=True, **kwargs
-    ):
+    def get_filtered_songs(self, pl_id, _and=None, _or=None, _not=False, **kwargs):
         """
-        Creates the mask used to filter a list of songs recursively. Called from
-        filter_playlist.
-        """
-        # Whether to OR the masks or AND them
-        logic = _or_iter if or_logic else _and_iter
-        # Initialize mask with Falses for OR and Trues for AND
-        mask = [not or_logic] * len(songs)
-
-        # Turn them into lists even if just one
-        if isinstance(_and, dict):
-            _and = [_and]
-        if isinstance(_or, dict):
-            _or = [_or]
-
-        # Find the masks for the _or and _and part
-        if _or:
-            for _or_n in _or:
-                mask = logic(self._build_mask(songs, **_or_n), mask)
-        if _and:
-            for _and_n in _and:
-                mask = logic(self._build_mask(songs, **_and_n, or_logic=False), mask)
-
-        # Add artists AND
-        if "artists_and" in kwargs:
-            mask = logic(
-                mask, self._make_mask_artists(songs, all, kwargs["artists_and"])
-            )
-        # Add artists OR
-        if "artists_or" in kwargs:
-            mask = logic(
-                mask, self._make_mask_artists(songs, any, kwargs["artists_or"])
-            )
-        # Add artist AND
-        if "artist_and" in kwargs:
-            mask = logic(mask, self._make_mask_artist(songs, all, kwargs["artist_and"]))
-        # Add artist OR
-        if "artist_or" in kwargs:
-            mask = logic(mask, self._make_mask_artist(songs, any, kwargs["artist_or"]))
-        # Add song EXACT
-        if "song_exact" in kwargs:
-            mask = logic(
-                mask, self._make_mask_song(songs, any, _equiv, kwargs["song_exact"])
-            )
-        # Add song AND
-        if "song_and" in kwargs:
-            mask = logic(
-                mask, self._make_mask_song(songs, all, _in, kwargs["song_and"])
-            )
-        # Add Song OR
-        if "song_or" in kwargs:
-            mask = logic(mask, self._make_mask_song(songs, any, _in, kwargs["song_or"]))
+        Returns the songs of a playlist that pass a filter, the same as
+        filter_playlist on the songs from get_playlist_songs (or its index if
+        self.index_songs). The result is kept under the playlist's snapshot
+        and the filters.canonical_spec of the filter, so asking again with
+        the same filter, even written differently, returns right away until
+        the playlist is changed through this User.
+
+        Parameters:
+        pl_id - The playlist id of the user to filter the songs of
+        _and, _or, _not, kwargs - The filter, see filter_playlist
+        """
+        spec = dict(kwargs, _and=_and, _or=_or, _not=_not)
+        return self._get_filtered_songs(pl_id, spec)
+
+    def _get_filtered_songs(self, pl_id, spec, workers=None):
+        """
+        get_filtered_songs with the filter as a dictionary, fetching the
+        songs with at most workers pages requested at once
+        """
+        playlist = self._get_playlist(pl_id)
+        key = (playlist.snapshot_id, canonical_spec(spec))
+        results = self.filter_cache.get(pl_id)
+        if results is None:
+            results = TTLCache(self.filter_cache_size, None)
+            self.filter_cache.set(pl_id, results)
+
+        songs = results.get(key)
+        if songs is None:
+            if self.index_songs:
+                songs = self.get_playlist_index(pl_id, workers)
+            else:
+                songs = self.get_playlist_songs(pl_id, workers)
+            songs = compile_filter(spec).filter(songs)
+            results.set(key, songs)
+        return songs
+
+    def filter_session(self, pl_id):
+        """
+        Returns a filters.FilterSession over the songs of a playlist (or its
+        index if self.index_songs), for filtering them again and again as the
+        filter is edited such as when searching as the user types
 
-        return _not_iter(mask) if _not else mask
+        Parameters:
+        pl_id - The playlist id of the user to filter the songs of
+        """
+        if self.index_songs:
+            return FilterSession(self.get_playlist_index(pl_id))
+        return FilterSession(self.get_playlist_songs(pl_id))
+
+    def filter_playlists(self, specs, workers=None):
+        """
+        Filters several playlists and returns every song that passes in a
+        single list, playlist after playlist in the order given. The
+        playlists are fetched and filtered at the same time, so it takes
+        about as long as the slowest one instead of all of them added up.
+        Each goes through get_filtered_songs, so its result is cached.
+
+        Parameters:
+        specs - Dictionary of playlist ID -> filter, each filter being a
+                dictionary of the keyword arguments of filter_playlist
+        workers - (default None) The most playlists worked on at once, uses
+                  self.max_workers if None. The pages of each playlist are
+                  then fetched a few at a time so that, all together, no
+                  more requests are in flight than there are connections in
+                  the pool
+        """
+        specs = list(specs.items())
+        if not specs:
+            return []
+
+        requests_at_once = min(self.max_workers, self.pool_size)
+        workers = min(workers or self.max_workers, len(specs), requests_at_once)
+        # Each playlist's pages share what's left of the connections, more
+        # requests than connections would open and throw away new ones
+        page_workers = max(1, requests_at_once // workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                lambda item: self._get_filtered_songs(
+                    item[0], dict(item[1]), page_workers
+                ),
+                specs,
+            )
+            return [song for songs in results for song in songs]
 
     def create_queue(self, song_ids, new_queue=True, duplicate=False):
         """
@@ -325,20 +591,14 @@ class User:
                     will append to the previous queue
         duplicate - (default False) If True, will add duplicate songs, else not
         """
+        song_uris = (self.TRACK + song_id for song_id in song_ids)
         # Remake the queue if it's a new queue
         if new_queue:
-            self.queue = [self.TRACK + song_id for song_id in song_ids]
+            self.queue = SongQueue(song_uris, duplicate=True)
         else:
-            # Else add to existing queue
-            for song_id in song_ids:
-                song_uri = self.TRACK + song_id
-                # Don't add duplicate to queue if not wanted
-                if not duplicate:
-                    if song_uri not in self.queue:
-                        self.queue.append(song_uri)
-                else:
-                    self.queue.append(song_uri)
-        self.play(data={"uris": self.queue})
+            # Else add to existing queue, without duplicates if not wanted
+            self.queue.extend(song_uris, duplicate)
+        self.play(data={"uris": self.queue.uris()})
 
     def create_playlist(self, songs, name, public=True):
         """
@@ -353,15 +613,17 @@ class User:
         # Create the playlist and store the playlist ID
         url = self.URL + "users/{}/playlists".format(self.user)
         data = {"name": name, "public": public}
-        pl_id = requests.post(url, headers=self.headers_json, data=dumps(data)).json()[
-            "id"
-        ]
-
-        # Add new playlist to the playlist info
-        self.playlists.append(name)
-        self.pl_ids.append(pl_id)
-        # Initialize the pl_len, length will be added in add_to_playlist
-        self.pl_lens.append(0)
+        playlist = self._request(
+            "POST", url, headers=self.JSON_HEADERS, data=dumps(data)
+        ).json()
+        pl_id = playlist["id"]
+
+        # Playlist IDs aren't reused, but don't trust anything held under it
+        self.song_cache.pop(pl_id)
+        self.filter_cache.pop(pl_id)
+        # Add new playlist to the playlist info, the size is added to in
+        # _add_to_playlist
+        self.playlists.add(Playlist(pl_id, name, playlist["snapshot_id"], self.user, 0))
 
         # Add the songs to the playlist
         self._add_to_playlist(pl_id, songs)
@@ -377,10 +639,41 @@ class User:
         """
         url = self.URL + "users/{}/playlists/{}/tracks".format(self.user, pl_id)
         data = {"uris": [self.TRACK + song for song in songs]}
-        requests.post(url, headers=self.headers_json, data=dumps(data))
-
-        # Increase number of songs for this playlist by this addition
-        self.pl_lens[self.pl_ids.index(pl_id)] += len(songs)
+        snapshot_id = self._request(
+            "POST", url, headers=self.JSON_HEADERS, data=dumps(data)
+        ).json()["snapshot_id"]
+
+        playlist = self.playlists[pl_id]
+        pl_songs = self.song_cache.get(pl_id)
+        if pl_songs is None and playlist.size == 0:
+            pl_songs = TrackTable(library=self.library)
+        self.filter_cache.pop(pl_id)
+
+        # Only the song IDs are known here, so if the library has every song
+        # add them to the loaded songs, otherwise refetch them when needed
+        rows = [self.library.row(song) for song in songs]
+        if pl_songs is None or None in rows:
+            self.song_cache.pop(pl_id)
+        else:
+            pl_songs.extend_rows(rows)
+            index = self._indexes.get(pl_songs)
+            if index is None:
+                self._cache_songs(pl_id, pl_songs)
+            else:
+                for row in rows:
+                    index.add(self.library.track(row))
+                self.song_cache.set(pl_id, pl_songs)
+        # The loaded songs may be older than what's on Spotify now, so don't
+        # save them to disk under the new snapshot, fetch it afresh instead
+        if self.track_cache is not None:
+            self.track_cache.delete(pl_id)
+
+        # Increase number of songs for this playlist by this addition and
+        # store the new snapshot so the cached songs are seen as out of date.
+        # Done last so subscribers see the songs already updated
+        self.playlists.update(
+            pl_id, size=playlist.size + len(songs), snapshot_id=snapshot_id
+        )
 
     def delete_playlist(self, pl_id):
         """
@@ -390,13 +683,14 @@ class User:
         pl_id - The id of the playlist to delete
         """
         url = self.URL + "users/{}/playlists/{}/followers".format(self.user, pl_id)
-        requests.delete(url, headers=self.headers)
+        self._request("DELETE", url)
 
         # Remove the playlist info
-        pl_ind = self.pl_ids.index(pl_id)
-        self.playlists.remove(self.playlists[pl_ind])
-        self.pl_ids.remove(pl_id)
-        self.pl_lens.remove(self.pl_lens[pl_ind])
+        self.song_cache.pop(pl_id)
+        self.filter_cache.pop(pl_id)
+        if self.track_cache is not None:
+            self.track_cache.delete(pl_id)
+        self.playlists.remove(pl_id)
 
     def is_expired(self):
         """
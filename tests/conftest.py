@@ -0,0 +1,22 @@
+from inspect import getsourcefile
+import os.path as path
+import sys
+
+import pytest
+
+cur_dir = path.dirname(path.abspath(getsourcefile(lambda: 0)))
+sys.path.insert(0, path.join(path.dirname(cur_dir), "spearch"))
+sys.path.insert(0, cur_dir)
+
+from stub_api import StubAPI
+
+
+@pytest.fixture
+def api():
+    """
+    A StubAPI with 120 playlists of 0 to 449 songs, so both the playlists
+    and the songs of most playlists span several pages
+    """
+    api = StubAPI([(i * 37) % 450 for i in range(120)]).start()
+    yield api
+    api.stop()
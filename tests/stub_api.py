@@ -0,0 +1,153 @@
+"""
+A stub of the parts of the Spotify Web API that User and AsyncUser page
+through, served on a local port so the real HTTP clients are exercised.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+from threading import Lock, Thread
+from time import sleep
+from urllib.parse import parse_qs, urlparse
+
+
+class StubAPI:
+    def __init__(self, playlist_sizes, token="token", delay=0):
+        """
+        Serves a user called 'me' with a playlist of each size, 'pl0',
+        'pl1'... Song i of a playlist is called 'Song {pl_id} {i}' by
+        'Artist {i % 7}'.
+
+        Parameters:
+        playlist_sizes - The number of songs in each playlist
+        token - (default 'token') The only access token accepted, requests
+                with any other get a 401 until it's changed
+        delay - (default 0) Seconds each response takes, so that requests
+                overlap like they do with the real API
+        """
+        self.playlists = [
+            {
+                "id": "pl{}".format(i),
+                "name": "Playlist {}".format(i),
+                "snapshot_id": "snapshot{}".format(i),
+                "owner": {"id": "me"},
+                "tracks": {"total": size},
+            }
+            for i, size in enumerate(playlist_sizes)
+        ]
+        self.token = token
+        self.delay = delay
+        # Every request as (method, path, dictionary of the query, status)
+        self.log = []
+        self._rate_limited = 0
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}/v1/".format(self._server.server_address[1])
+
+    def start(self):
+        Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def rate_limit(self, requests):
+        """
+        Answers the next few requests with a 429 and a Retry-After of 0
+        """
+        with self._lock:
+            self._rate_limited = requests
+
+    def requests(self, path=None, status=None):
+        """
+        Returns the logged requests, only those to a path ending with path
+        and/or with a status if given
+        """
+        with self._lock:
+            return [
+                request
+                for request in self.log
+                if (path is None or request[1].endswith(path))
+                and (status is None or request[3] == status)
+            ]
+
+    def songs(self, pl_id, offset, limit):
+        """
+        The page of songs of a playlist starting at offset
+        """
+        size = self._playlist(pl_id)["tracks"]["total"]
+        return [
+            {
+                "track": {
+                    "name": "Song {} {}".format(pl_id, i),
+                    "id": "{}song{}".format(pl_id, i),
+                    "artists": [{"name": "Artist {}".format(i % 7)}],
+                }
+            }
+            for i in range(offset, min(size, offset + limit))
+        ]
+
+    def _playlist(self, pl_id):
+        return next(playlist for playlist in self.playlists if playlist["id"] == pl_id)
+
+    def respond(self, method, path, query, token):
+        """
+        Returns (status, JSON body, headers) for a request
+        """
+        with self._lock:
+            if self._rate_limited:
+                self._rate_limited -= 1
+                return 429, {"error": "rate limited"}, {"Retry-After": "0"}
+        if token != self.token:
+            return 401, {"error": "expired token"}, {}
+
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", 100))
+        if path == "/v1/me/":
+            return 200, {"id": "me"}, {}
+        if path == "/v1/me/playlists":
+            page = self.playlists[offset : offset + limit]
+            return 200, {"items": page, "total": len(self.playlists)}, {}
+        match = re.match(r"/v1/users/me/playlists/(\w+)/tracks$", path)
+        if match:
+            pl_id = match.group(1)
+            return 200, {"items": self.songs(pl_id, offset, limit)}, {}
+        match = re.match(r"/v1/playlists/(\w+)$", path)
+        if match:
+            playlist = self._playlist(match.group(1))
+            return 200, {"snapshot_id": playlist["snapshot_id"]}, {}
+        return 404, {"error": "not found"}, {}
+
+
+def _handler(api):
+    """
+    Makes the request handler class answering with api
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            token = self.headers.get("Authorization", "")[len("Bearer ") :]
+            sleep(api.delay)
+            status, body, headers = api.respond("GET", url.path, query, token)
+            with api._lock:
+                api.log.append(("GET", url.path, query, status))
+
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime as dt
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from async_user import AsyncRequestScheduler, AsyncUser
+from auth import TokenProvider
+
+
+def run(api, coroutine, **kwargs):
+    """
+    Opens an AsyncUser of the stub API and returns what coroutine(user) does
+    """
+
+    async def main():
+        user = AsyncUser(
+            kwargs.pop("token", api.token),
+            dt.now(),
+            url=api.url,
+            scheduler=AsyncRequestScheduler(backoff=0),
+            **kwargs
+        )
+        async with user:
+            return await coroutine(user)
+
+    return asyncio.run(main())
+
+
+def expected_names(api, pl_id):
+    size = next(pl for pl in api.playlists if pl["id"] == pl_id)["tracks"]["total"]
+    return [song["track"]["name"] for song in api.songs(pl_id, 0, size)]
+
+
+def test_pages_through_playlists(api):
+    ids = run(api, lambda user: asyncio.sleep(0, user.playlists.ids()))
+
+    assert ids == [pl["id"] for pl in api.playlists]
+    offsets = [int(q.get("offset", 0)) for _, _, q, _ in api.requests("me/playlists")]
+    assert sorted(offsets) == [0, 50, 100]
+
+
+def test_pages_through_songs(api):
+    songs = run(api, lambda user: user.get_playlist_songs("pl11"))
+
+    assert [song[0] for song in songs] == expected_names(api, "pl11")
+    offsets = [int(q["offset"]) for _, _, q, _ in api.requests("pl11/tracks")]
+    assert sorted(offsets) == [0, 100, 200, 300, 400]
+
+
+def test_iterates_songs_in_order(api):
+    async def songs(user):
+        return [song async for song in user.iter_playlist_songs("pl11", window=2)]
+
+    songs = run(api, songs)
+
+    assert [song[0] for song in songs] == expected_names(api, "pl11")
+    assert len(api.requests("pl11/tracks")) == 5
+
+
+def test_retries_rate_limited_requests(api):
+    async def songs(user):
+        api.rate_limit(3)
+        return await asyncio.gather(
+            user.get_playlist_songs("pl11"), user.get_playlist_songs("pl12")
+        )
+
+    first, second = run(api, songs)
+
+    assert [song[0] for song in first] == expected_names(api, "pl11")
+    assert [song[0] for song in second] == expected_names(api, "pl12")
+    assert len(api.requests(status=429)) == 3
+
+
+def test_refreshes_token_on_401(api):
+    refreshed = []
+
+    def refresh():
+        refreshed.append(api.token)
+        return api.token, dt.now(), 3600
+
+    # The user starts with a token the API no longer takes
+    provider = TokenProvider(refresh, "revoked", dt.now())
+    songs = run(
+        api, lambda user: user.get_playlist_songs("pl11"), token_provider=provider
+    )
+
+    assert [song[0] for song in songs] == expected_names(api, "pl11")
+    assert refreshed == ["token"]
+    assert provider.access_token == "token"
+    assert len(api.requests(status=401)) == 1
+
+
+def test_gives_up_on_401_without_token_provider(api):
+    with pytest.raises(aiohttp.ClientResponseError):
+        run(api, lambda user: asyncio.sleep(0), token="revoked")
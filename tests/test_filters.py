@@ -0,0 +1,235 @@
+"""
+Checks the filter engine against a straightforward reimplementation of how
+User.filter_playlist filtered before it was compiled into predicates: build
+a list of booleans per keyword by checking every song, then AND or OR them.
+FilterSession is checked against filtering every song afresh.
+"""
+
+import random
+
+import pytest
+
+import filters
+from filters import (
+    MULTI_MATCH_ARTIST_TERMS,
+    MULTI_MATCH_NAME_TERMS,
+    FilterSession,
+    compile_filter,
+)
+from index import TrackIndex
+from table import TrackLibrary, TrackTable
+from tracks import as_track
+
+# Lowercase and casefold agree on all of these, the old filter used lower()
+WORDS = ["love", "Lil", "big", "Night", "é", "ab", "the", "Yes", "no", "a", "e", "Ba"]
+ARTISTS = ["Lil Wayne", "Big Sean", "Beyoncé", "ABBA", "The Night", "Yes", "no one"]
+KEYWORDS = [
+    "artists_and",
+    "artists_or",
+    "artist_and",
+    "artist_or",
+    "song_exact",
+    "song_and",
+    "song_or",
+]
+
+
+def _lower(texts):
+    return [text.lower() for text in texts]
+
+
+# How the old filter checked a song for each keyword, with the terms lowercase
+OLD_KEYWORDS = {
+    "artists_and": lambda song, terms: all(t in _lower(song[1]) for t in terms),
+    "artists_or": lambda song, terms: any(t in _lower(song[1]) for t in terms),
+    "artist_and": lambda song, terms: any(
+        all(t in artist for t in terms) for artist in _lower(song[1])
+    ),
+    "artist_or": lambda song, terms: any(
+        any(t in artist for t in terms) for artist in _lower(song[1])
+    ),
+    "song_exact": lambda song, terms: any(t == song[0].lower() for t in terms),
+    "song_and": lambda song, terms: all(t in song[0].lower() for t in terms),
+    "song_or": lambda song, terms: any(t in song[0].lower() for t in terms),
+}
+
+
+def old_mask(songs, _and=None, _or=None, _not=False, or_logic=True, **kwargs):
+    """
+    The list of whether each song passes a spec, the way the old filter did it
+    """
+    if isinstance(_and, dict):
+        _and = [_and]
+    if isinstance(_or, dict):
+        _or = [_or]
+
+    masks = [old_mask(songs, **spec) for spec in _or or ()]
+    masks += [old_mask(songs, or_logic=False, **spec) for spec in _and or ()]
+    for keyword, terms in kwargs.items():
+        terms = _lower(terms)
+        masks.append([OLD_KEYWORDS[keyword](song, terms) for song in songs])
+
+    combine = any if or_logic else all
+    mask = [combine(passed) for passed in zip(*masks)] if masks else None
+    if mask is None:
+        mask = [not or_logic] * len(songs)
+    return [not passed for passed in mask] if _not else mask
+
+
+def make_songs(rng, size):
+    return [
+        (
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))),
+            tuple(rng.sample(ARTISTS, rng.randint(1, 3))),
+            "id{}".format(i),
+        )
+        for i in range(size)
+    ]
+
+
+def make_terms(rng, keyword, songs):
+    if keyword.startswith("artists"):
+        return rng.sample(ARTISTS + ["lil wayne", "abba"], rng.randint(1, 2))
+    if keyword == "song_exact":
+        return [rng.choice(songs)[0].upper(), "love"]
+    if keyword in ("song_or", "artist_or") and rng.random() < 0.1:
+        # Long enough to be matched by a MultiMatcher
+        many = max(MULTI_MATCH_NAME_TERMS, MULTI_MATCH_ARTIST_TERMS)
+        return ["x{}y".format(i) for i in range(many)] + rng.sample(WORDS, 2)
+    return rng.sample(WORDS, rng.randint(1, 3))
+
+
+def make_spec(rng, songs, depth):
+    spec = {}
+    for keyword in rng.sample(KEYWORDS, rng.randint(0, 3)):
+        spec[keyword] = make_terms(rng, keyword, songs)
+    if depth > 0:
+        if rng.random() < 0.6:
+            spec["_and"] = make_spec(rng, songs, depth - 1)
+        if rng.random() < 0.6:
+            spec["_or"] = [
+                make_spec(rng, songs, depth - 1) for _ in range(rng.randint(1, 2))
+            ]
+    if rng.random() < 0.3:
+        spec["_not"] = True
+    return spec
+
+
+@pytest.mark.parametrize("kind", ["list", "table", "index"])
+def test_matches_old_filter(kind):
+    rng = random.Random(7)
+    songs = make_songs(rng, 400)
+    if kind == "list":
+        filtered = songs
+    else:
+        filtered = TrackTable(songs, TrackLibrary())
+        if kind == "index":
+            filtered = TrackIndex(filtered)
+
+    for _ in range(150):
+        spec = make_spec(rng, songs, 3)
+        # The old filter ignored _not at the top, only nested ones counted
+        spec.pop("_not", None)
+        expected = [
+            song for song, passed in zip(songs, old_mask(songs, **spec)) if passed
+        ]
+
+        passed = compile_filter(spec).filter(filtered)
+        assert [tuple(song[:3]) for song in passed] == expected, spec
+
+
+def edit_spec(rng, state):
+    """
+    Changes a filter a little like someone editing it would: typing more of
+    a term, adding or dropping a term or keyword, or flipping _not. Returns
+    the new state, a dictionary of keyword -> terms and _not.
+    """
+    state = {
+        key: list(value) if key != "_not" else value for key, value in state.items()
+    }
+    keywords = [key for key in state if key != "_not"]
+    edit = rng.randrange(5)
+    if edit == 0 and keywords:
+        terms = state[rng.choice(keywords)]
+        position = rng.randrange(len(terms))
+        terms[position] += rng.choice("aeilnostvy ")
+    elif edit == 1 and keywords:
+        state[rng.choice(keywords)].append(rng.choice(WORDS).lower()[:2])
+    elif edit == 2 and keywords:
+        keyword = rng.choice(keywords)
+        state[keyword].pop(rng.randrange(len(state[keyword])))
+        if not state[keyword]:
+            del state[keyword]
+    elif edit == 3:
+        keyword = rng.choice(["song_and", "song_or", "artist_and", "artist_or"])
+        state.setdefault(keyword, []).append(rng.choice(WORDS).lower()[:1])
+    else:
+        state["_not"] = not state.get("_not", False)
+    return state
+
+
+@pytest.mark.parametrize("kind", ["list", "table", "index"])
+def test_session_matches_fresh_filter(kind, monkeypatch):
+    narrowed = []
+    implies = filters._implies
+
+    def spy(new, old):
+        result = implies(new, old)
+        narrowed.append(result)
+        return result
+
+    monkeypatch.setattr(filters, "_implies", spy)
+    rng = random.Random(11)
+    songs = make_songs(rng, 300)
+    if kind != "list":
+        songs = TrackTable(songs, TrackLibrary())
+        if kind == "index":
+            songs = TrackIndex(songs)
+    session = FilterSession(songs)
+
+    state = {"song_and": ["l"]}
+    for step in range(300):
+        if kind != "list" and rng.random() < 0.2:
+            # Songs added to the playlist between two filters
+            for song in make_songs(rng, rng.randint(1, 3)):
+                song = song[:2] + ("new{}{}".format(step, song[2]),)
+                if kind == "index":
+                    songs.add(as_track(song))
+                else:
+                    songs.append(as_track(song))
+        state = edit_spec(rng, state)
+        spec = {"_and": state}
+
+        passed = session.filter(spec)
+        fresh = compile_filter(spec).filter(songs)
+        assert [tuple(song[:3]) for song in passed] == [
+            tuple(song[:3]) for song in fresh
+        ], spec
+    # Both the narrowed and the checking every song paths were taken
+    assert any(narrowed) and not all(narrowed)
+
+
+def test_implies():
+    def tree(spec):
+        return filters._logic_tree(filters.canonical_spec(spec), or_logic=True)
+
+    def implies(new, old):
+        return filters._implies(tree(new), tree(old))
+
+    # Typing more of a term or adding a term to an AND narrows it
+    assert implies({"song_and": ["love"]}, {"song_and": ["lo"]})
+    assert implies({"song_and": ["lo", "ni"]}, {"song_and": ["lo"]})
+    assert implies({"song_or": ["love"]}, {"song_or": ["lo", "ni"]})
+    assert implies({"_and": {"song_or": ["a"], "artist_or": ["b"]}}, {"song_or": ["a"]})
+    assert implies(
+        {"_and": {"_not": True, "song_or": ["lo"]}},
+        {"_and": {"_not": True, "song_or": ["love"]}},
+    )
+    # Dropping a term from an AND or adding one to an OR broadens it
+    assert not implies({"song_and": ["lo"]}, {"song_and": ["lo", "ni"]})
+    assert not implies({"song_or": ["lo", "ni"]}, {"song_or": ["lo"]})
+    assert not implies({"song_and": ["lo"]}, {"song_and": ["love"]})
+    assert not implies(
+        {"_and": {"_not": True, "song_or": ["love"]}},
+        {"_and": {"_not": True, "song_or": ["lo"]}},
+    )
@@ -0,0 +1,39 @@
+from datetime import datetime as dt
+import logging
+
+import pytest
+
+from scheduler import RequestScheduler
+from stub_api import StubAPI
+from user import User
+
+
+@pytest.fixture
+def slow_api():
+    """
+    A StubAPI whose responses take long enough for requests to pile up
+    """
+    api = StubAPI([(i * 37) % 450 for i in range(40)], delay=0.01).start()
+    yield api
+    api.stop()
+
+
+def make_user(api, **kwargs):
+    """
+    A User of the stub API whose scheduler never holds requests back
+    """
+    stub_user = type("StubUser", (User,), {"URL": api.url, "ME_URL": api.url + "me/"})
+    scheduler = RequestScheduler(rate=10000, burst=10000, backoff=0)
+    return stub_user(api.token, dt.now(), scheduler=scheduler, **kwargs)
+
+
+def test_filter_playlists_stays_within_pool(slow_api, caplog):
+    caplog.set_level(logging.WARNING, logger="urllib3")
+    user = make_user(slow_api, pool_size=10, max_workers=8)
+    ids = [playlist.id for playlist in user.playlists if playlist.size > 300]
+
+    songs = user.filter_playlists({pl_id: {"song_or": ["song"]} for pl_id in ids})
+
+    assert len(songs) == sum(user.playlists[pl_id].size for pl_id in ids)
+    discarded = [r for r in caplog.records if "pool is full" in r.getMessage()]
+    assert not discarded